@@ -15,6 +15,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>
 
+import re, bisect
+
 from lemma.services.node_type_db import NodeTypeDB
 import lemma.services.timer as timer
 
@@ -255,6 +257,10 @@ class Paragraph():
         self.nodes = nodes
         self.layout = None
         self.xml = None
+        self.words = None
+        self.word_starts = None
+        self.placeholders = None
+        self.list_item_numbers = None
 
         self.style = 'p'
         self.indentation_level = 0
@@ -263,6 +269,36 @@ class Paragraph():
     def invalidate(self):
         self.layout = None
         self.xml = None
+        self.words = None
+        self.word_starts = None
+        self.placeholders = None
+
+    # placeholders in document order, including the ones inside math.
+    def get_placeholders(self):
+        if self.placeholders == None:
+            self.placeholders = [node for child in self.nodes for node in child.flatten() if node.type == 'placeholder']
+        return self.placeholders
+
+    # one character per node, widgets and math count as part of a word.
+    def get_text(self):
+        text = ''
+        for node in self.nodes:
+            if node.type == 'char':
+                text += node.value
+            elif node.type == 'eol':
+                text += '\n'
+            else:
+                text += '\ufffc'
+        return text
+
+    # words are runs of nodes between whitespace, the end is the node after the last one.
+    def get_word_bounds(self, node):
+        if self.words == None:
+            self.words = [match.span() for match in re.finditer(r'\S+', self.get_text())]
+            self.word_starts = [start for start, end in self.words]
+
+        start, end = self.words[bisect.bisect_right(self.word_starts, self.nodes.index(node)) - 1]
+        return (self.nodes[start], self.nodes[min(end, len(self.nodes) - 1)])
 
 
 class Node():
@@ -387,6 +423,7 @@ class Node():
 
     def word_bounds(self):
         if NodeTypeDB.is_whitespace(self): return (None, None)
+        if self.parent.type == 'root': return self.paragraph().get_word_bounds(self)
 
         node1 = self
         node2 = self
@@ -15,7 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>
 
-import time
+import time, bisect
 
 import lemma.services.xml_helpers as xml_helpers
 import lemma.services.xml_parser as xml_parser
@@ -48,6 +48,7 @@ class Document():
         self.plaintext = None
         self.xml = None
         self.links = set()
+        self.layout_cache = dict()
 
         self.change_flag = dict()
         self.query_cache = dict()
@@ -185,6 +186,7 @@ class Document():
     def resize_widget(self, node, new_width):
         if node.type != 'widget': return
 
+        new_width = max(node.value.get_minimum_width(), min(self.get_max_widget_width(node), new_width))
         self.command_manager.add_command('resize_widget', node, new_width)
 
     @undoable_action
@@ -286,6 +288,12 @@ class Document():
         self.links_scanner.update()
         self.xml_scanner.update()
 
+    def update_background_layout(self):
+        if self.layouter.update_background_layout():
+            self.query_cache = dict()
+            return True
+        return False
+
     def has_changed(self, client):
         if client not in self.change_flag:
             self.change_flag[client] = True
@@ -332,7 +340,7 @@ class Document():
     def selected_widget_is_max(self):
         if 'selected_widget_is_max' not in self.query_cache:
             selected_nodes = self.get_selected_nodes()
-            self.query_cache['selected_widget_is_max'] = (self.widget_selected() and (selected_nodes[0].value.get_width() == LayoutInfo.get_max_layout_width() or not selected_nodes[0].value.is_resizable()))
+            self.query_cache['selected_widget_is_max'] = (self.widget_selected() and (selected_nodes[0].value.get_width() >= self.get_max_widget_width(selected_nodes[0]) or not selected_nodes[0].value.is_resizable()))
         return self.query_cache['selected_widget_is_max']
 
     def selected_widget_is_min(self):
@@ -357,6 +365,37 @@ class Document():
             self.query_cache['has_selection'] = self.cursor.has_selection()
         return self.query_cache['has_selection']
 
+    def has_placeholders(self):
+        if 'has_placeholders' not in self.query_cache:
+            self.query_cache['has_placeholders'] = any(len(paragraph.get_placeholders()) > 0 for paragraph in self.ast.paragraphs)
+        return self.query_cache['has_placeholders']
+
+    # the first placeholder at or after node, wrapping around at the end of the document.
+    def get_next_placeholder(self, node):
+        if not self.has_placeholders(): return None
+
+        paragraphs = self.ast.paragraphs
+        position = node.get_position()
+        paragraph_no, offset = self.ast.index_to_paragraph_no_offset(position[0])
+        for placeholder in paragraphs[paragraph_no].get_placeholders():
+            if placeholder.get_position() >= position: return placeholder
+        for i in range(paragraph_no + 1, paragraph_no + len(paragraphs) + 1):
+            placeholders = paragraphs[i % len(paragraphs)].get_placeholders()
+            if len(placeholders) > 0: return placeholders[0]
+
+    # the last placeholder at or before node, wrapping around at the start of the document.
+    def get_prev_placeholder(self, node):
+        if not self.has_placeholders(): return None
+
+        paragraphs = self.ast.paragraphs
+        position = node.get_position()
+        paragraph_no, offset = self.ast.index_to_paragraph_no_offset(position[0])
+        for placeholder in reversed(paragraphs[paragraph_no].get_placeholders()):
+            if placeholder.get_position() <= position: return placeholder
+        for i in range(paragraph_no - 1, paragraph_no - len(paragraphs) - 1, -1):
+            placeholders = paragraphs[i % len(paragraphs)].get_placeholders()
+            if len(placeholders) > 0: return placeholders[-1]
+
     def get_selected_nodes(self):
         if 'selected_nodes' not in self.query_cache:
             bounds = self.get_insert_node(), self.get_selection_node()
@@ -394,6 +433,14 @@ class Document():
     def get_width(self):
         return self.ast.paragraphs[0].layout['width']
 
+    def get_layout_width(self):
+        return self.layouter.layout_width
+
+    # widgets are scaled down to the width of their line, so they can't be made wider than that.
+    def get_max_widget_width(self, node):
+        paragraph = node.paragraph()
+        return self.get_layout_width() - LayoutInfo.get_indentation(paragraph.style, paragraph.indentation_level)
+
     def get_current_scrolling_offsets(self):
         return self.clipping.get_current_offsets()
 
@@ -417,30 +464,41 @@ class Document():
         line = self.get_line_layout_at_y(y)
 
         if y >= line['y'] + line['parent']['y'] and y < line['y'] + line['parent']['y'] + line['height']:
-            for layout in self.layouter.flatten_layout(line):
-                if layout['node'] != None and layout['node'].type in {'char', 'widget', 'placeholder', 'eol', 'end'}:
-                    layout_x, layout_y = self.get_absolute_xy(layout)
-                    if x >= layout_x and x <= layout_x + layout['width'] and y >= layout_y and y <= layout_y + layout['height']:
-                        return layout
+            for child in self.get_line_children_at_x(line, x):
+                for layout in self.layouter.flatten_layout(child):
+                    if layout['node'] != None and layout['node'].type in {'char', 'widget', 'placeholder', 'eol', 'end'}:
+                        layout_x, layout_y = self.get_absolute_xy(layout)
+                        if x >= layout_x and x <= layout_x + layout['width'] and y >= layout_y and y <= layout_y + layout['height']:
+                            return layout
         return None
 
     def get_cursor_holding_layout_close_to_xy(self, x, y):
         if y < 0: x = 0
-        if y > self.get_height(): x = LayoutInfo.get_max_layout_width()
-
-        hbox = self.get_line_layout_at_y(y)
-        if y >= hbox['y'] + hbox['parent']['y'] and y < hbox['y'] + hbox['parent']['y'] + hbox['height']:
-            for layout in self.layouter.flatten_layout(hbox):
-                if layout['type'] == 'hbox':
-                    layout_x, layout_y = self.get_absolute_xy(layout)
-                    if x >= layout_x and x <= layout_x + layout['width'] \
-                            and y >= layout_y and y <= layout_y + layout['height'] \
-                            and hbox in self.get_ancestors(layout):
-                        hbox = layout
+        if y > self.get_height(): x = self.get_layout_width()
+
+        line = self.get_line_layout_at_y(y)
+        hbox = line
+        if y >= line['y'] + line['parent']['y'] and y < line['y'] + line['parent']['y'] + line['height']:
+            for child in self.get_line_children_at_x(line, x):
+                for layout in self.layouter.flatten_layout(child):
+                    if layout['type'] == 'hbox':
+                        layout_x, layout_y = self.get_absolute_xy(layout)
+                        if x >= layout_x and x <= layout_x + layout['width'] \
+                                and y >= layout_y and y <= layout_y + layout['height'] \
+                                and hbox in self.get_ancestors(layout):
+                            hbox = layout
+
+        return self.get_child_closest_to_x(hbox, x)
+
+    def get_child_closest_to_x(self, hbox, x):
+        if 'child_xs' in hbox:
+            children = self.get_line_children_close_to_x(hbox, x)
+        else:
+            children = hbox['children']
 
         closest_layout = None
         min_distance = 10000
-        for layout in hbox['children']:
+        for layout in children:
             layout_x, layout_y = self.get_absolute_xy(layout)
             distance = abs(layout_x - x)
             if distance < min_distance:
@@ -449,27 +507,103 @@ class Document():
 
         return closest_layout
 
+    # children of a line are sorted by x, so the ones that can contain x are found by bisection.
+    def get_line_children_at_x(self, line, x):
+        x -= line['x'] + line['parent']['x']
+        children = line['children']
+        end = bisect.bisect_right(line['child_xs'], x)
+        start = end
+        while start > 0 and children[start - 1]['x'] + children[start - 1]['width'] >= x:
+            start -= 1
+        return children[start:end]
+
+    def get_line_children_close_to_x(self, line, x):
+        x -= line['x'] + line['parent']['x']
+        child_xs = line['child_xs']
+        end = bisect.bisect_left(child_xs, x)
+        start = end
+        while start > 0 and (start == end or child_xs[start - 1] == child_xs[end - 1]):
+            start -= 1
+        return line['children'][start:end + 1]
+
     def get_line_layout_at_y(self, y):
         if y < 0:
-            return self.ast.paragraphs[0].layout['children'][0]
+            paragraph = self.ast.paragraphs[0]
         elif y > self.get_height():
-            return self.ast.paragraphs[-1].layout['children'][-1]
+            paragraph = self.ast.paragraphs[-1]
         else:
-            for paragraph in self.ast.paragraphs:
-                if y >= paragraph.layout['y'] and y < paragraph.layout['y'] + paragraph.layout['height']:
-                    y -= paragraph.layout['y']
-                    for line in paragraph.layout['children']:
-                        if y >= line['y'] and y < line['y'] + line['height']:
-                            return line
+            paragraph = self.ast.paragraphs[max(bisect.bisect_right(self.layouter.paragraph_tops, y) - 1, 0)]
 
-    def get_absolute_xy(self, layout):
-        x, y = (0, 0)
+        if self.layouter.is_pending(paragraph):
+            self.realize_paragraph(paragraph)
+            return self.get_line_layout_at_y(y)
 
-        while not layout == None:
-            x += layout['x']
-            y += layout['y']
-            layout = layout['parent']
+        if y < 0:
+            return paragraph.layout['children'][0]
+        elif y > self.get_height():
+            return paragraph.layout['children'][-1]
+        else:
+            y -= paragraph.layout['y']
+            line = paragraph.layout['children'][max(bisect.bisect_right(paragraph.layout['line_tops'], y) - 1, 0)]
+            if y >= line['y'] and y < line['y'] + line['height']:
+                return line
+
+    # the first paragraph reaching down to y.
+    def get_paragraph_no_at_y(self, y):
+        return max(bisect.bisect_left(self.layouter.paragraph_tops, y) - 1, 0)
+
+    # lines above and below a line, closest first. paragraphs still waiting for the background layout are laid out on the way.
+    def get_lines_above(self, line):
+        paragraph_no = bisect.bisect_right(self.layouter.paragraph_tops, line['parent']['y']) - 1
+        lines = line['parent']['children']
+        for hbox in reversed(lines[:lines.index(line)]):
+            yield hbox
+
+        for paragraph_no in range(paragraph_no - 1, -1, -1):
+            paragraph = self.ast.paragraphs[paragraph_no]
+            if self.layouter.is_pending(paragraph):
+                self.realize_paragraph(paragraph)
+            for hbox in reversed(paragraph.layout['children']):
+                yield hbox
+
+    def get_lines_below(self, line):
+        paragraph_no = bisect.bisect_right(self.layouter.paragraph_tops, line['parent']['y']) - 1
+        lines = line['parent']['children']
+        for hbox in lines[lines.index(line) + 1:]:
+            yield hbox
+
+        for paragraph_no in range(paragraph_no + 1, len(self.ast.paragraphs)):
+            paragraph = self.ast.paragraphs[paragraph_no]
+            if self.layouter.is_pending(paragraph):
+                self.realize_paragraph(paragraph)
+            for hbox in paragraph.layout['children']:
+                yield hbox
+
+    def realize_paragraph(self, paragraph):
+        self.layouter.realize(paragraph)
+        self.layouter.update_y_offsets()
+        self.query_cache = dict()
+
+    # scrolling animations draw between the current offset and their target, the background layout only knows the target.
+    def realize_paragraphs_in_range(self, top, bottom):
+        if self.layouter.realize_paragraphs_in_range(top, bottom):
+            self.query_cache = dict()
 
-        return x, y
+    # offsets within a paragraph are cached until its lines change, the paragraph offset is added on top.
+    def get_absolute_xy(self, layout):
+        if 'paragraph_offset' in layout:
+            paragraph_layout, version, x, y = layout['paragraph_offset']
+            if paragraph_layout['version'] == version:
+                return x + paragraph_layout['x'], y + paragraph_layout['y']
+
+        x, y = (0, 0)
+        paragraph_layout = layout
+        while paragraph_layout['parent'] != None:
+            x += paragraph_layout['x']
+            y += paragraph_layout['y']
+            paragraph_layout = paragraph_layout['parent']
+        layout['paragraph_offset'] = (paragraph_layout, paragraph_layout['version'], x, y)
+
+        return x + paragraph_layout['x'], y + paragraph_layout['y']
 
 
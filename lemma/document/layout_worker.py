@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# Copyright (C) 2017-present Robert Griesel
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>
+
+import threading, bisect, collections, traceback
+
+
+class LayoutWorker(object):
+
+    def __init__(self, layouter):
+        self.layouter = layouter
+
+        self.lock = threading.Lock()
+        self.thread = None
+        self.jobs = dict()
+        self.job_positions = list()
+        self.anchor = 0
+        self.results = collections.deque()
+        self.failed = dict()
+
+    # jobs are (paragraph_no, paragraph, placeholder) in document order, replacing all previous jobs.
+    def set_jobs(self, jobs, anchor=0):
+        with self.lock:
+            self.jobs = {paragraph_no: (paragraph, placeholder) for paragraph_no, paragraph, placeholder in jobs}
+            self.job_positions = [paragraph_no for paragraph_no, paragraph, placeholder in jobs]
+            self.anchor = anchor
+
+            if len(self.jobs) > 0 and self.thread == None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def set_anchor(self, anchor):
+        with self.lock:
+            self.anchor = anchor
+
+    def get_results(self):
+        results = []
+        while len(self.results) > 0:
+            results.append(self.results.popleft())
+        return results
+
+    def is_idle(self):
+        return self.thread == None and len(self.results) == 0
+
+    # take the job closest to the anchor, i.e. the paragraphs close to the viewport come first.
+    def take_job(self):
+        with self.lock:
+            if len(self.job_positions) == 0:
+                self.thread = None
+                return None
+
+            index = bisect.bisect_left(self.job_positions, self.anchor)
+            if index == len(self.job_positions):
+                index -= 1
+            elif index > 0 and self.anchor - self.job_positions[index - 1] < self.job_positions[index] - self.anchor:
+                index -= 1
+
+            paragraph_no = self.job_positions.pop(index)
+            return (paragraph_no,) + self.jobs.pop(paragraph_no)
+
+    # unless a newer job replaced it, a failed paragraph is tried once more.
+    def requeue_job(self, paragraph_no, paragraph, placeholder):
+        with self.lock:
+            if paragraph_no in self.jobs: return
+
+            self.jobs[paragraph_no] = (paragraph, placeholder)
+            bisect.insort(self.job_positions, paragraph_no)
+
+    def run(self):
+        while True:
+            job = self.take_job()
+            if job == None: return
+
+            paragraph_no, paragraph, placeholder = job
+            try:
+                layout_tree = self.layouter.make_paragraph_layout(paragraph)
+                self.failed.pop(paragraph, None)
+
+            # the paragraph may have been edited while we were working on it, so it gets a second try.
+            # if that fails too, the main thread lays it out itself.
+            except Exception:
+                traceback.print_exc()
+                if self.failed.pop(paragraph, None) != placeholder['version']:
+                    self.failed[paragraph] = placeholder['version']
+                    self.requeue_job(paragraph_no, paragraph, placeholder)
+                    continue
+                layout_tree = None
+
+            self.results.append((paragraph, placeholder, layout_tree))
+
+
@@ -15,40 +15,322 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>
 
+import hashlib, itertools, bisect
+
 from lemma.services.text_shaper import TextShaper
 from lemma.services.character_db import CharacterDB
 from lemma.services.node_type_db import NodeTypeDB
 from lemma.services.layout_info import LayoutInfo
+from lemma.services.xml_exporter import XMLExporter
+from lemma.document.layout_worker import LayoutWorker
+from lemma.application_state.application_state import ApplicationState
 import lemma.services.timer as timer
 
 
 class Layouter(object):
 
+    # documents with more paragraphs to lay out than this are partly laid out in the background.
+    background_layout_threshold = 200
+
+    # font classification only depends on the fontname_key, so it's shared by all nodes and documents.
+    fontnames = dict()
+
+    # laid out math boxes only depend on their structure, fonts and leaf extents, so they're shared as well.
+    math_layouts = dict()
+    max_math_layouts = 10000
+
+    # paragraph layouts get a new version whenever their lines change, this invalidates cached box offsets.
+    layout_versions = itertools.count()
+
     def __init__(self, document):
         self.document = document
         self.paragraph_style = None
 
+        self.layout_width = None
+        self.paragraph_tops = list()
+        self.paragraph_numbers = dict()
+        self.moved_from = None
+        self.worker = None
+        self.pending = dict()
+        self.last_viewport = None
+
     def update(self):
         if self.document.has_changed(self):
             self.update_layout()
+        if len(self.pending) > 0:
+            self.realize_cursor_paragraphs()
 
     @timer.timer
     def update_layout(self):
+        self.update_layout_width()
+        paragraphs = self.document.ast.paragraphs
+        in_background = sum(1 for paragraph in paragraphs if paragraph.layout == None) > self.background_layout_threshold
+        viewport_top, viewport_bottom = self.get_viewport()
+
+        self.paragraph_numbers = {paragraph: paragraph_no for paragraph_no, paragraph in enumerate(paragraphs)}
+
         y_offset = 0
-        for paragraph in self.document.ast.paragraphs:
-            if paragraph.layout == None:
-                self.paragraph_style = paragraph.style
+        paragraph_tops = list()
+        list_item_numbers = (0, 0, 0, 0, 0)
+        for paragraph in paragraphs:
+            list_item_numbers = self.get_list_item_numbers(paragraph, list_item_numbers)
+            paragraph.list_item_numbers = list_item_numbers
 
-                indentation = LayoutInfo.get_indentation(paragraph.style, paragraph.indentation_level)
-                width = LayoutInfo.get_max_layout_width() - indentation
+            if paragraph.layout == None:
+                if paragraph.xml == None:
+                    paragraph.xml = XMLExporter.export_paragraph(paragraph.nodes, paragraph.style, paragraph.indentation_level, paragraph.state)
 
-                layout_tree = self.make_layout_tree_paragraph(self.document.ast, paragraph)
-                self.layout_paragraph(layout_tree, width, indentation)
-                paragraph.layout = layout_tree
-            else:
-                layout_tree = paragraph.layout
+                if in_background and (y_offset < viewport_top or y_offset > viewport_bottom):
+                    self.set_pending(paragraph)
+                else:
+                    self.realize(paragraph)
+            layout_tree = paragraph.layout
             layout_tree['y'] = y_offset
+            paragraph_tops.append(y_offset)
             y_offset += layout_tree['height']
+        self.paragraph_tops = paragraph_tops
+        self.moved_from = None
+
+        if len(self.pending) > 0:
+            self.update_jobs()
+        self.prune_layout_cache()
+
+    # every edit leaves the entry of the paragraph's old version behind, these are dropped once the cache has doubled.
+    def prune_layout_cache(self):
+        paragraphs = self.document.ast.paragraphs
+        if len(self.document.layout_cache) <= 2 * len(paragraphs): return
+
+        keys = set()
+        for paragraph in paragraphs:
+            if paragraph in self.pending:
+                keys.add(self.get_layout_cache_key(paragraph))
+            else:
+                keys.add(paragraph.layout['layout_cache_key'])
+        self.document.layout_cache = {key: entry for key, entry in self.document.layout_cache.items() if key in keys}
+
+    # numbers of ordered list items on each indentation level, up to and including this paragraph.
+    def get_list_item_numbers(self, paragraph, list_item_numbers):
+        level = paragraph.indentation_level
+        if paragraph.style == 'ol':
+            return list_item_numbers[:level] + (list_item_numbers[level] + 1,) + (0,) * (4 - level)
+        return list_item_numbers[:level] + (0,) * (5 - level)
+
+    def make_paragraph_layout(self, paragraph):
+        self.paragraph_style = paragraph.style
+
+        indentation = LayoutInfo.get_indentation(paragraph.style, paragraph.indentation_level)
+        width = self.get_layout_width() - indentation
+
+        layout_tree = self.make_layout_tree_paragraph(self.document.ast, paragraph)
+        self.layout_paragraph(layout_tree, width, indentation)
+        return layout_tree
+
+    def realize(self, paragraph):
+        if paragraph in self.pending:
+            del(self.pending[paragraph])
+
+        layout_tree = self.make_paragraph_layout(paragraph)
+        self.set_layout(paragraph, layout_tree)
+
+    # layouts made by the worker are only published on the main thread, after checking the paragraph wasn't edited in the meantime.
+    def set_layout(self, paragraph, layout_tree):
+        self.attach_layout(layout_tree)
+        if layout_tree['layout_cache_key'] != None:
+            self.document.layout_cache[layout_tree['layout_cache_key']] = layout_tree['layout_cache_entry']
+        if paragraph.layout != None:
+            layout_tree['y'] = paragraph.layout['y']
+            if layout_tree['height'] != paragraph.layout['height']:
+                self.set_moved_from(self.get_paragraph_no(paragraph) + 1)
+        paragraph.layout = layout_tree
+
+    # node.layout is only set once a paragraph layout is complete, so layouts built off the main thread can be published atomically.
+    def attach_layout(self, layout_tree):
+        if layout_tree['type'] in {'char', 'eol', 'end', 'placeholder', 'widget', 'mathscript', 'mathfraction', 'mathroot'}:
+            layout_tree['node'].layout = layout_tree
+        for child in layout_tree['children']:
+            self.attach_layout(child)
+
+    # placeholders keep the document height roughly right until the worker is done with a paragraph.
+    def set_pending(self, paragraph):
+        fontname = paragraph.style if paragraph.style.startswith('h') else 'book'
+        line_height = TextShaper.get_ascend(fontname=fontname) - TextShaper.get_descend(fontname=fontname)
+        height = (len(paragraph.nodes) // 80 + 1) * line_height
+        width = self.layout_width - LayoutInfo.get_indentation(paragraph.style, paragraph.indentation_level)
+
+        placeholder = {'type': 'paragraph', 'fixed': False, 'node': paragraph, 'parent': None, 'children': [], 'x': 0, 'y': 0, 'width': width, 'height': height, 'fontname': None}
+        placeholder['version'] = next(Layouter.layout_versions)
+        line = {'type': 'hbox', 'fixed': False, 'node': None, 'parent': placeholder, 'children': [], 'x': 0, 'y': 0, 'width': 0, 'height': height, 'fontname': None}
+        placeholder['children'].append(line)
+
+        paragraph.layout = placeholder
+        self.pending[paragraph] = placeholder
+
+    def is_pending(self, paragraph):
+        return paragraph in self.pending
+
+    def update_jobs(self):
+        jobs = []
+        pending = dict()
+        for paragraph_no, paragraph in enumerate(self.document.ast.paragraphs):
+            if paragraph in self.pending and paragraph.layout is self.pending[paragraph]:
+                jobs.append((paragraph_no, paragraph, paragraph.layout))
+                pending[paragraph] = paragraph.layout
+        self.pending = pending
+
+        if self.worker == None:
+            self.worker = LayoutWorker(Layouter(self.document))
+        self.worker.set_jobs(jobs, self.get_anchor())
+
+    # called on every frame, publishes finished paragraphs and lays out what became visible in the meantime.
+    @timer.timer
+    def update_background_layout(self):
+        if self.update_layout_width():
+            self.set_moved_from(0)
+            self.update_y_offsets()
+            return True
+        if len(self.pending) == 0 and (self.worker == None or self.worker.is_idle()): return False
+
+        layout_changed = False
+        for paragraph, placeholder, layout_tree in self.worker.get_results():
+            # layout trees reference themselves, so they are compared by identity.
+            # paragraphs removed from the document may still hold their placeholder, but aren't pending anymore.
+            if paragraph.layout is not placeholder or self.pending.get(paragraph) is not placeholder: continue
+
+            indentation = LayoutInfo.get_indentation(paragraph.style, paragraph.indentation_level)
+            if layout_tree == None:
+                layout_tree = self.make_paragraph_layout(paragraph)
+            elif layout_tree['width'] != self.layout_width - indentation:
+                self.reflow_paragraph(layout_tree, self.layout_width - indentation, indentation)
+            self.set_layout(paragraph, layout_tree)
+            del(self.pending[paragraph])
+            layout_changed = True
+
+        if self.get_viewport() != self.last_viewport:
+            self.last_viewport = self.get_viewport()
+            layout_changed = self.realize_visible_paragraphs() or layout_changed
+
+        layout_changed = self.realize_cursor_paragraphs() or layout_changed
+
+        self.update_y_offsets()
+        return layout_changed
+
+    # on resize paragraphs are only broken into lines again, their words don't have to be measured another time.
+    def update_layout_width(self):
+        layout_width = self.get_layout_width()
+        if layout_width == self.layout_width: return False
+        self.layout_width = layout_width
+
+        layout_changed = False
+        for paragraph in self.document.ast.paragraphs:
+            indentation = LayoutInfo.get_indentation(paragraph.style, paragraph.indentation_level)
+            if paragraph.layout == None or paragraph.layout['width'] == layout_width - indentation: continue
+
+            if paragraph in self.pending:
+                paragraph.layout['width'] = layout_width - indentation
+            else:
+                self.reflow_paragraph(paragraph.layout, layout_width - indentation, indentation)
+            layout_changed = True
+        return layout_changed
+
+    def get_layout_width(self):
+        view_width = ApplicationState.get_value('document_view_width')
+        if view_width <= 0:
+            return LayoutInfo.get_default_layout_width()
+        return max(LayoutInfo.get_min_layout_width(), view_width - 2 * LayoutInfo.get_document_padding_left())
+
+    def realize_visible_paragraphs(self):
+        viewport_top, viewport_bottom = self.get_viewport()
+
+        paragraphs = self.document.ast.paragraphs
+        anchor = None
+        realized = False
+        for paragraph_no in range(max(bisect.bisect_right(self.paragraph_tops, viewport_top) - 1, 0), len(paragraphs)):
+            paragraph = paragraphs[paragraph_no]
+            if paragraph.layout['y'] + paragraph.layout['height'] >= viewport_top and paragraph.layout['y'] <= viewport_bottom:
+                if anchor == None:
+                    anchor = paragraph_no
+                if paragraph in self.pending:
+                    self.realize(paragraph)
+                    realized = True
+            elif paragraph.layout['y'] > viewport_bottom:
+                break
+
+        if anchor != None and self.worker != None:
+            self.worker.set_anchor(anchor)
+        return realized
+
+    # paragraphs between two y coordinates, heights of the ones realized on the way are taken into account.
+    def realize_paragraphs_in_range(self, top, bottom):
+        paragraphs = self.document.ast.paragraphs
+        start = max(bisect.bisect_right(self.paragraph_tops, top) - 1, 0)
+        y_offset = self.paragraph_tops[start] if start < len(self.paragraph_tops) else 0
+
+        realized = False
+        for paragraph in paragraphs[start:]:
+            if y_offset > bottom: break
+
+            if paragraph in self.pending:
+                self.realize(paragraph)
+                realized = True
+            y_offset += paragraph.layout['height']
+        if realized:
+            self.update_y_offsets()
+        return realized
+
+    # edits can send the cursor's paragraphs back to the worker without moving the cursor, so this is checked every time.
+    def realize_cursor_paragraphs(self):
+        realized = False
+        for node in (self.document.cursor.get_insert_node(), self.document.cursor.get_selection_node()):
+            paragraph = node.paragraph()
+            if paragraph in self.pending:
+                self.realize(paragraph)
+                realized = True
+        if realized:
+            self.update_y_offsets()
+        return realized
+
+    # the paragraph list only changes in update_layout, so between updates paragraphs can be looked up by number.
+    def get_paragraph_no(self, paragraph):
+        paragraph_no = self.paragraph_numbers.get(paragraph, 0)
+        paragraphs = self.document.ast.paragraphs
+        if paragraph_no < len(paragraphs) and paragraphs[paragraph_no] == paragraph:
+            return paragraph_no
+        return 0
+
+    def set_moved_from(self, paragraph_no):
+        if self.moved_from == None or paragraph_no < self.moved_from:
+            self.moved_from = paragraph_no
+
+    # paragraph tops are kept in a sorted list, so lines can be looked up by bisection.
+    # only the paragraphs below the first one that changed its height have to be moved.
+    def update_y_offsets(self):
+        if self.moved_from == None: return
+
+        paragraphs = self.document.ast.paragraphs
+        start = min(self.moved_from, len(self.paragraph_tops), len(paragraphs))
+        self.moved_from = None
+        if start == 0:
+            y_offset = 0
+        else:
+            y_offset = self.paragraph_tops[start - 1] + paragraphs[start - 1].layout['height']
+
+        del(self.paragraph_tops[start:])
+        for paragraph in paragraphs[start:]:
+            paragraph.layout['y'] = y_offset
+            self.paragraph_tops.append(y_offset)
+            y_offset += paragraph.layout['height']
+
+    def get_viewport(self):
+        view_height = max(ApplicationState.get_value('document_view_height'), 1000)
+        y = self.document.clipping.target_y - LayoutInfo.get_normal_document_offset()
+        return (y - view_height, y + 2 * view_height)
+
+    def get_anchor(self):
+        viewport_top = self.get_viewport()[0]
+        for paragraph_no, paragraph in enumerate(self.document.ast.paragraphs):
+            if paragraph.layout['y'] + paragraph.layout['height'] >= viewport_top:
+                return paragraph_no
+        return 0
 
     @timer.timer
     def make_layout_tree_paragraph(self, root, paragraph):
@@ -63,29 +345,63 @@ class Layouter(object):
                        'height': 0,
                        'fontname': None}
 
-        nodes = paragraph.nodes
-        for child in self.group_words(nodes):
+        # word advances and line breaks are kept with the document, so known paragraphs aren't shaped again.
+        # this may run on the worker thread, so the document's entry is only read. set_layout publishes the new one.
+        key = self.get_layout_cache_key(paragraph)
+        cache_entry = self.document.layout_cache.get(key)
+        if cache_entry == None:
+            cache_entry = {'advances': None, 'line_breaks': dict()}
+        layout_tree['line_breaks'] = dict(cache_entry['line_breaks'])
+
+        children = self.group_words(paragraph.nodes)
+        words = [child for child in children if isinstance(child, list)]
+        fontnames = [self.get_fontname_from_node(char_nodes[0]) for char_nodes in words]
+        if cache_entry['advances'] != None:
+            advances = cache_entry['advances']
+        else:
+            advances = self.measure_words(words, fontnames)
+
+        word_no = 0
+        for child in children:
             if isinstance(child, list):
                 char_nodes = child
-                text = ''.join([char.value for char in char_nodes])
-                fontname = self.get_fontname_from_node(char_nodes[0])
+                fontname = fontnames[word_no]
+                extents_list = advances[word_no]
+                word_no += 1
+
                 subtree = {'type': 'word', 'fixed': False, 'node': root, 'parent': layout_tree, 'children': [], 'x': 0, 'y': 0, 'width': 0, 'height': 0, 'fontname': fontname}
-                for char_node, extents in zip(char_nodes, TextShaper.measure(text, fontname=fontname)):
+                for char_node, extents in zip(char_nodes, extents_list):
                     subsubtree = {'type': 'char','fixed': True, 'node': char_node, 'parent': subtree, 'children': [], 'x': 0, 'y': 0, 'width': extents[0], 'height': extents[1], 'fontname': fontname}
-                    char_node.layout = subsubtree
                     subtree['children'].append(subsubtree)
             else:
                 subtree = self.make_layout_tree(child, layout_tree)
             layout_tree['children'].append(subtree)
 
+        layout_tree['layout_cache_key'] = key
+        layout_tree['layout_cache_entry'] = {'advances': advances, 'line_breaks': layout_tree['line_breaks']}
+
         return layout_tree
 
-    def make_layout_tree(self, node, parent=None):
+    # all words of a paragraph set in the same font are shaped in one go.
+    def measure_words(self, words, fontnames):
+        advances = [None] * len(words)
+        for fontname in set(fontnames):
+            word_nos = [word_no for word_no, name in enumerate(fontnames) if name == fontname]
+            texts = [''.join([char.value for char in words[word_no]]) for word_no in word_nos]
+            for word_no, extents_list in zip(word_nos, TextShaper.measure_words(texts, fontname=fontname)):
+                advances[word_no] = extents_list
+        return advances
+
+    def get_layout_cache_key(self, paragraph):
+        xml = paragraph.xml
+        if xml == None: return None
+        return hashlib.sha1(xml.encode('utf8')).digest()
+
+    def make_layout_tree(self, node, parent=None, small_math=False, index=0):
         if node.type == 'char':
-            fontname = self.get_fontname_from_node(node)
+            fontname = self.get_fontname_from_node(node, small_math)
             width, height = TextShaper.measure_single(node.value, fontname=fontname)
             layout_tree = {'type': 'char', 'fixed': True, 'node': node, 'parent': parent, 'children': [], 'x': 0, 'y': 0, 'width': width, 'height': height, 'fontname': fontname}
-            node.layout = layout_tree
             return layout_tree
 
         layout_tree = {'type': None,
@@ -102,32 +418,28 @@ class Layouter(object):
         if node.type == 'eol':
             layout_tree['type'] = 'eol'
             layout_tree['fixed'] = True
-            layout_tree['fontname'] = self.get_fontname_from_node(node)
+            layout_tree['fontname'] = self.get_fontname_from_node(node, small_math)
             layout_tree['width'] = 1
             width, height = TextShaper.measure_single('\n', fontname=layout_tree['fontname'])
             layout_tree['height'] = height
-            node.layout = layout_tree
         elif node.type == 'end':
             layout_tree['type'] = 'end'
             layout_tree['fixed'] = True
-            layout_tree['fontname'] = self.get_fontname_from_node(node)
+            layout_tree['fontname'] = self.get_fontname_from_node(node, small_math)
             layout_tree['width'] = 1
             width, height = TextShaper.measure_single('\n', fontname=layout_tree['fontname'])
             layout_tree['height'] = height
-            node.layout = layout_tree
         elif node.type == 'placeholder':
             layout_tree['type'] = 'placeholder'
             layout_tree['fixed'] = True
-            layout_tree['fontname'] = self.get_fontname_from_node(node)
+            layout_tree['fontname'] = self.get_fontname_from_node(node, small_math)
             width, height = TextShaper.measure_single('▯', fontname=layout_tree['fontname'])
             layout_tree['width'] = width
             layout_tree['height'] = height
-            node.layout = layout_tree
         elif node.type == 'widget':
             layout_tree['type'] = 'widget'
             layout_tree['fixed'] = True
-            layout_tree['fontname'] = self.get_fontname_from_node(node)
-            node.layout = layout_tree
+            layout_tree['fontname'] = self.get_fontname_from_node(node, small_math)
             width, height = layout_tree['node'].value.get_width(), layout_tree['node'].value.get_height()
             height -= 2 * TextShaper.get_descend(fontname=layout_tree['fontname'])
             layout_tree['width'] = width
@@ -135,27 +447,26 @@ class Layouter(object):
         elif node.type == 'mathscript':
             layout_tree['type'] = 'mathscript'
             layout_tree['fixed'] = False
-            layout_tree['fontname'] = self.get_fontname_from_node(node)
-            node.layout = layout_tree
+            layout_tree['fontname'] = self.get_fontname_from_node(node, small_math)
         elif node.type == 'mathfraction':
             layout_tree['type'] = 'mathfraction'
             layout_tree['fixed'] = False
-            layout_tree['fontname'] = self.get_fontname_from_node(node)
-            node.layout = layout_tree
+            layout_tree['fontname'] = self.get_fontname_from_node(node, small_math)
         elif node.type == 'mathroot':
             layout_tree['type'] = 'mathroot'
             layout_tree['fixed'] = False
-            layout_tree['fontname'] = self.get_fontname_from_node(node)
-            node.layout = layout_tree
+            layout_tree['fontname'] = self.get_fontname_from_node(node, small_math)
         elif node.type == 'mathlist':
             layout_tree['type'] = 'hbox'
             layout_tree['fixed'] = False
-            layout_tree['fontname'] = self.get_fontname_from_node(node)
+            layout_tree['fontname'] = self.get_fontname_from_node(node, small_math)
         else:
             return None
 
-        for child in node:
-            subtree = self.make_layout_tree(child, layout_tree)
+        # sub- and superscripts, fractions and root indices are set in the small math font.
+        children_small_math = node.type == 'mathlist' and (node.parent.type in {'mathscript', 'mathfraction'} or (node.parent.type == 'mathroot' and index == 1))
+        for child_index, child in enumerate(node):
+            subtree = self.make_layout_tree(child, layout_tree, children_small_math, child_index)
             if subtree != None:
                 layout_tree['children'].append(subtree)
 
@@ -184,10 +495,55 @@ class Layouter(object):
         if layout_tree['type'] == 'word': self.layout_word(layout_tree)
         elif layout_tree['type'] == 'hbox': self.layout_hbox(layout_tree)
         elif layout_tree['type'] == 'vbox': self.layout_vbox(layout_tree)
-        elif layout_tree['type'] == 'mathscript': self.layout_mathscript(layout_tree)
+        elif layout_tree['type'] in {'mathscript', 'mathfraction', 'mathroot'}: self.layout_math(layout_tree)
+
+    def layout_math(self, layout_tree):
+        boxes = self.flatten_layout(layout_tree)
+        key = tuple((box['type'], box['fontname'], len(box['children']), box['width'] if box['fixed'] else None, box['height'] if box['fixed'] else None) for box in boxes)
+
+        # both threads use this, the other one may clear it between a check and a lookup.
+        geometry = Layouter.math_layouts.get(key)
+        if geometry != None:
+            self.restore_geometry(boxes, geometry)
+            return
+
+        if layout_tree['type'] == 'mathscript': self.layout_mathscript(layout_tree)
         elif layout_tree['type'] == 'mathfraction': self.layout_mathfraction(layout_tree)
         elif layout_tree['type'] == 'mathroot': self.layout_mathroot(layout_tree)
 
+        if len(Layouter.math_layouts) >= Layouter.max_math_layouts:
+            Layouter.math_layouts.clear()
+        Layouter.math_layouts[key] = self.save_geometry(boxes, layout_tree)
+
+    # the geometry of a subtree is stored in depth first order, as (index in boxes or None for added vboxes, index of the parent, x, y, width, height).
+    def save_geometry(self, boxes, layout_tree):
+        indices = {id(box): index for index, box in enumerate(boxes)}
+        laid_out_boxes = self.flatten_layout(layout_tree)
+        parent_indices = {id(box): index for index, box in enumerate(laid_out_boxes)}
+
+        math_layout = []
+        for index, box in enumerate(laid_out_boxes):
+            parent_index = parent_indices[id(box['parent'])] if index > 0 else None
+            math_layout.append((indices.get(id(box)), parent_index, box['x'], box['y'], box['width'], box['height']))
+        return tuple(math_layout)
+
+    def restore_geometry(self, boxes, geometry):
+        laid_out_boxes = []
+        for index, parent_index, x, y, width, height in geometry:
+            if index == None:
+                box = {'type': 'vbox', 'fixed': False, 'node': None, 'parent': None, 'children': [], 'x': 0, 'y': 0, 'width': 0, 'height': 0, 'fontname': None}
+            else:
+                box = boxes[index]
+                box['children'] = []
+            if parent_index != None:
+                box['parent'] = laid_out_boxes[parent_index]
+                laid_out_boxes[parent_index]['children'].append(box)
+            box['x'] = x
+            box['y'] = y
+            box['width'] = width
+            box['height'] = height
+            laid_out_boxes.append(box)
+
     def layout_word(self, layout_tree):
         layout_tree['width'] = 0
         layout_tree['height'] = 0
@@ -203,44 +559,85 @@ class Layouter(object):
             if not child['fixed']:
                 self.layout(child)
 
-        lines = list()
-        current_line = {'type': 'hbox', 'fixed': False, 'node': None, 'parent': layout_tree, 'children': [], 'x': 0, 'y': 0, 'width': 0, 'height': 0, 'fontname': None}
-        current_line_width = 0
+        # measured children are kept, so the paragraph can be broken into lines again when the layout width changes.
+        layout_tree['measured'] = []
         for child in layout_tree['children']:
-            if child['type'] == 'eol' or child['type'] == 'end':
-                current_line['children'].append(child)
-                child['parent'] = current_line
-            else:
-                break_after_char = (child['type'] == 'char' and NodeTypeDB.is_whitespace(child['node']))
-                if break_after_char:
-                    current_line['children'].append(child)
-                    child['parent'] = current_line
-                    current_line_width += child['width']
-                    if current_line_width > 0 and child['width'] + current_line_width > layout_width:
-                        lines.append(current_line)
-                        current_line = {'type': 'hbox', 'fixed': False, 'node': None, 'parent': layout_tree, 'children': [], 'x': 0, 'y': 0, 'width': 0, 'height': 0, 'fontname': None}
-                        current_line_width = 0
-                else:
-                    if current_line_width > 0 and child['width'] + current_line_width > layout_width:
-                        lines.append(current_line)
-                        current_line = {'type': 'hbox', 'fixed': False, 'node': None, 'parent': layout_tree, 'children': [], 'x': 0, 'y': 0, 'width': 0, 'height': 0, 'fontname': None}
-                        current_line_width = 0
-                    current_line['children'].append(child)
-                    child['parent'] = current_line
-                    current_line_width += child['width']
-        lines.append(current_line)
+            boxes = self.flatten_layout(child)
+            layout_tree['measured'].append((child, boxes, self.save_geometry(boxes, child)))
+
+        self.break_lines(layout_tree, layout_width, indentation)
+
+    @timer.timer
+    def reflow_paragraph(self, layout_tree, layout_width, indentation):
+        for child, boxes, geometry in layout_tree['measured']:
+            self.restore_geometry(boxes, geometry)
+
+        self.break_lines(layout_tree, layout_width, indentation)
+
+    def break_lines(self, layout_tree, layout_width, indentation):
+        children = [child for child, boxes, geometry in layout_tree['measured']]
+        for child in children:
+            if child['type'] == 'widget':
+                self.fit_widget(child, layout_width)
+        line_breaks = self.get_line_breaks(layout_tree, children, layout_width)
+
+        lines = list()
+        for start, end in zip([0] + line_breaks, line_breaks + [len(children)]):
+            line = {'type': 'hbox', 'fixed': False, 'node': None, 'parent': layout_tree, 'children': children[start:end], 'x': 0, 'y': 0, 'width': 0, 'height': 0, 'fontname': None}
+            for child in line['children']:
+                child['parent'] = line
+            lines.append(line)
 
         layout_tree['height'] = 0
+        layout_tree['line_tops'] = list()
         for line in lines:
             self.layout_hbox(line)
+            line['child_xs'] = [child['x'] for child in line['children']]
             line['x'] = indentation
             line['y'] = layout_tree['height']
+            layout_tree['line_tops'].append(line['y'])
             layout_tree['height'] += line['height']
         layout_tree['children'] = lines
+        layout_tree['version'] = next(Layouter.layout_versions)
         layout_tree['width'] = layout_width
         layout_tree['x'] = 0
         layout_tree['y'] = 0
 
+    # widgets keep their own width, but are scaled down to the layout width when it is smaller.
+    def fit_widget(self, layout_tree, layout_width):
+        widget = layout_tree['node'].value
+        width = min(widget.get_width(), layout_width)
+        height = int(widget.get_height() * width / widget.get_width())
+        layout_tree['width'] = width
+        layout_tree['height'] = height - 2 * TextShaper.get_descend(fontname=layout_tree['fontname'])
+
+    # returns the indices of the children starting a new line, the results for the last few widths are kept.
+    def get_line_breaks(self, layout_tree, children, layout_width):
+        if layout_width in layout_tree['line_breaks']:
+            return layout_tree['line_breaks'][layout_width]
+
+        line_breaks = list()
+        current_line_width = 0
+        for index, child in enumerate(children):
+            if child['type'] == 'eol' or child['type'] == 'end':
+                continue
+
+            if child['type'] == 'char' and NodeTypeDB.is_whitespace(child['node']):
+                current_line_width += child['width']
+                if current_line_width > 0 and child['width'] + current_line_width > layout_width:
+                    line_breaks.append(index + 1)
+                    current_line_width = 0
+            else:
+                if current_line_width > 0 and child['width'] + current_line_width > layout_width:
+                    line_breaks.append(index)
+                    current_line_width = 0
+                current_line_width += child['width']
+
+        if len(layout_tree['line_breaks']) >= 4:
+            del(layout_tree['line_breaks'][next(iter(layout_tree['line_breaks']))])
+        layout_tree['line_breaks'][layout_width] = line_breaks
+        return line_breaks
+
     def layout_vbox(self, layout_tree):
         for child in layout_tree['children']:
             if not child['fixed']:
@@ -321,8 +718,7 @@ class Layouter(object):
             layout_tree['children'][0]['children'][1]['height'] = layout_tree['children'][0]['children'][0]['height']
             layout_tree['children'][0]['height'] += layout_tree['children'][0]['children'][1]['height']
 
-        fontname = self.get_fontname_from_node(layout_tree['node'])
-        extents = TextShaper.measure_single(' ', fontname=fontname)
+        extents = TextShaper.measure_single(' ', fontname=layout_tree['fontname'])
 
         layout_tree['children'][0]['x'] = 1
         layout_tree['children'][0]['y'] = extents[1] / 2 - layout_tree['children'][0]['height'] / 2
@@ -368,8 +764,7 @@ class Layouter(object):
         for child in layout_tree['children'][0]['children'][1]['children']:
             child['y'] += 2
 
-        fontname = self.get_fontname_from_node(layout_tree['node'])
-        extents = TextShaper.measure_single(' ', fontname=fontname)
+        extents = TextShaper.measure_single(' ', fontname=layout_tree['fontname'])
 
         layout_tree['children'][0]['x'] = 1
         layout_tree['children'][0]['y'] = extents[1] / 2 - layout_tree['children'][0]['height'] / 2
@@ -394,27 +789,31 @@ class Layouter(object):
         layout_tree['x'] = None
         layout_tree['y'] = None
 
-    def get_fontname_from_node(self, node=None):
-        if NodeTypeDB.is_subscript(node) or NodeTypeDB.is_superscript(node):
-            return 'math_small'
-        if NodeTypeDB.in_fraction(node):
+    def get_fontname_from_node(self, node, small_math=False):
+        key = (node.type, node.value if node.type == 'char' else None, 'bold' in node.tags, 'italic' in node.tags, small_math, self.paragraph_style)
+        if key not in Layouter.fontnames:
+            Layouter.fontnames[key] = self.classify_font(*key)
+        return Layouter.fontnames[key]
+
+    def classify_font(self, node_type, char, bold, italic, small_math, paragraph_style):
+        if small_math:
             return 'math_small'
-        if node.type == 'char' and CharacterDB.is_mathsymbol(node.value):
+        if node_type == 'char' and CharacterDB.is_mathsymbol(char):
             return 'math'
-        if node.value != None and node.type == 'char' and node.value.isnumeric():
+        if node_type == 'char' and char.isnumeric():
             return 'math'
-        if node.type == 'placeholder':
+        if node_type == 'placeholder':
             return 'math'
 
-        if node.type == 'char' and CharacterDB.is_emoji(node.value):
+        if node_type == 'char' and CharacterDB.is_emoji(char):
             return 'emojis'
 
-        if self.paragraph_style.startswith('h'):
-            return self.paragraph_style
+        if paragraph_style.startswith('h'):
+            return paragraph_style
 
-        if 'bold' in node.tags and 'italic' not in node.tags: return 'bold'
-        if 'bold' in node.tags and 'italic' in node.tags: return 'bolditalic'
-        if 'bold' not in node.tags and 'italic' in node.tags: return 'italic'
+        if bold and not italic: return 'bold'
+        if bold and italic: return 'bolditalic'
+        if not bold and italic: return 'italic'
 
         return 'book'
 
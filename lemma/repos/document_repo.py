@@ -20,6 +20,7 @@ import os.path, os, pickle
 from lemma.document.document import Document
 from lemma.services.xml_parser import XMLParser
 from lemma.services.paths import Paths
+from lemma.repos.layout_cache_repo import LayoutCacheRepo
 import lemma.services.xml_helpers as xml_helpers
 import lemma.services.timer as timer
 
@@ -60,6 +61,8 @@ class DocumentRepo():
             pathname = os.path.join(Paths.get_stubs_folder(), str(document_id))
             os.remove(pathname)
 
+        LayoutCacheRepo.init(DocumentRepo.document_stubs_by_id)
+
         if len(DocumentRepo.document_stubs_by_id) > 0:
             DocumentRepo.max_document_id = max(DocumentRepo.document_stubs_by_id)
         else:
@@ -126,6 +129,7 @@ class DocumentRepo():
                 document.ast.append_paragraph(paragraph)
 
         document.title = parser.title
+        document.layout_cache = LayoutCacheRepo.get_by_document_id(document_id)
         document.cursor.set_state([document.ast[0].get_position(), document.ast[0].get_position()])
         document.update()
         document.change_flag[DocumentRepo] = False
@@ -170,6 +174,8 @@ class DocumentRepo():
             os.remove(pathname)
         except FileNotFoundError: pass
 
+        LayoutCacheRepo.delete(document_id)
+
     @timer.timer
     def update(document):
         if not document.has_changed(DocumentRepo): return
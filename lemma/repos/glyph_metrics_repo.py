@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# Copyright (C) 2017-present Robert Griesel
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>
+
+import os.path, os, pickle, hashlib
+
+from lemma.services.paths import Paths
+from lemma.services.app_info import AppInfo
+from lemma.services.text_shaper import TextShaper
+import lemma.services.timer as timer
+
+
+class GlyphMetricsRepo():
+
+    file_hashes = dict()
+    file_hashes_changed = False
+    loaded_counts = dict()
+
+    # fonts are identified by the hash of their file, so updated fonts aren't measured with stale metrics.
+    def get_pathname(fontname):
+        file_hash = GlyphMetricsRepo.get_file_hash(TextShaper.fonts[fontname]['filename'])
+        return os.path.join(Paths.get_glyph_metrics_folder(), file_hash + '_' + str(TextShaper.fonts[fontname]['size']))
+
+    # hashes are remembered with the size and modification time of the file, a font is only read again when one of them changed.
+    def get_file_hash(filename):
+        stat_result = os.stat(filename)
+        signature = (stat_result.st_size, stat_result.st_mtime)
+        if filename in GlyphMetricsRepo.file_hashes and GlyphMetricsRepo.file_hashes[filename][0] == signature:
+            return GlyphMetricsRepo.file_hashes[filename][1]
+
+        with open(filename, 'rb') as file:
+            file_hash = hashlib.sha1(file.read()).hexdigest()
+        GlyphMetricsRepo.file_hashes[filename] = (signature, file_hash)
+        GlyphMetricsRepo.file_hashes_changed = True
+        return file_hash
+
+    @timer.timer
+    def init():
+        GlyphMetricsRepo.file_hashes = GlyphMetricsRepo.get_file_hashes()
+
+        for fontname in TextShaper.fonts:
+            pathname = GlyphMetricsRepo.get_pathname(fontname)
+            advances = GlyphMetricsRepo.get_by_pathname(pathname)
+            GlyphMetricsRepo.loaded_counts[pathname] = len(advances)
+            TextShaper.add_char_advances(fontname, advances)
+
+        if GlyphMetricsRepo.file_hashes_changed:
+            GlyphMetricsRepo.update_file_hashes()
+
+    def get_file_hashes():
+        pathname = os.path.join(Paths.get_glyph_metrics_folder(), 'file_hashes')
+        if not os.path.isfile(pathname): return dict()
+
+        with open(pathname, 'rb') as file:
+            try:
+                return pickle.load(file)
+            except (EOFError, pickle.UnpicklingError): return dict()
+
+    def update_file_hashes():
+        pathname = os.path.join(Paths.get_glyph_metrics_folder(), 'file_hashes')
+        try: filehandle = open(pathname, 'wb')
+        except IOError: pass
+        else:
+            with filehandle:
+                pickle.dump(GlyphMetricsRepo.file_hashes, filehandle)
+            GlyphMetricsRepo.file_hashes_changed = False
+
+    def get_by_pathname(pathname):
+        if not os.path.isfile(pathname): return dict()
+
+        with open(pathname, 'rb') as file:
+            try:
+                data = pickle.load(file)
+            except (EOFError, pickle.UnpicklingError): return dict()
+
+        if data['version'] != AppInfo.get_lemma_version(): return dict()
+        return data['advances']
+
+    # styles sharing a font file and size share one file, it's only written when new glyphs were measured.
+    @timer.timer
+    def update():
+        advances_by_pathname = dict()
+        for fontname in TextShaper.fonts:
+            pathname = GlyphMetricsRepo.get_pathname(fontname)
+            if pathname not in advances_by_pathname:
+                advances_by_pathname[pathname] = dict()
+            advances_by_pathname[pathname].update(TextShaper.get_char_advances(fontname))
+
+        for pathname, advances in advances_by_pathname.items():
+            if len(advances) == GlyphMetricsRepo.loaded_counts.get(pathname, 0): continue
+
+            try: filehandle = open(pathname, 'wb')
+            except IOError: pass
+            else:
+                with filehandle:
+                    pickle.dump({'version': AppInfo.get_lemma_version(), 'advances': advances}, filehandle)
+                GlyphMetricsRepo.loaded_counts[pathname] = len(advances)
+
+
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# Copyright (C) 2017-present Robert Griesel
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>
+
+import os.path, os, pickle
+
+from lemma.services.paths import Paths
+from lemma.services.app_info import AppInfo
+from lemma.services.text_shaper import TextShaper
+import lemma.services.timer as timer
+
+
+class LayoutCacheRepo():
+
+    @timer.timer
+    def init(document_ids):
+        for direntry in os.scandir(Paths.get_layout_cache_folder()):
+            if not direntry.name.isdigit() or int(direntry.name) not in document_ids:
+                os.remove(direntry.path)
+
+    def get_config():
+        return (AppInfo.get_lemma_version(), TextShaper.get_font_config())
+
+    @timer.timer
+    def get_by_document_id(document_id):
+        pathname = os.path.join(Paths.get_layout_cache_folder(), str(document_id))
+        if not os.path.isfile(pathname): return dict()
+
+        with open(pathname, 'rb') as file:
+            try:
+                data = pickle.load(file)
+            except (EOFError, pickle.UnpicklingError): return dict()
+
+        if data['config'] != LayoutCacheRepo.get_config(): return dict()
+        return data['paragraphs']
+
+    # only entries of current paragraphs are kept, the ones of edited or deleted paragraphs are dropped.
+    @timer.timer
+    def update(document):
+        if document == None: return
+
+        paragraphs = dict()
+        for paragraph in document.ast.paragraphs:
+            key = document.layouter.get_layout_cache_key(paragraph)
+            if key in document.layout_cache:
+                entry = document.layout_cache[key]
+                paragraphs[key] = {'advances': entry['advances'], 'line_breaks': dict(entry['line_breaks'])}
+        document.layout_cache = paragraphs
+
+        pathname = os.path.join(Paths.get_layout_cache_folder(), str(document.id))
+        try: filehandle = open(pathname, 'wb')
+        except IOError: pass
+        else:
+            with filehandle:
+                pickle.dump({'config': LayoutCacheRepo.get_config(), 'paragraphs': paragraphs}, filehandle)
+
+    def delete(document_id):
+        pathname = os.path.join(Paths.get_layout_cache_folder(), str(document_id))
+        try:
+            os.remove(pathname)
+        except FileNotFoundError: pass
+
+
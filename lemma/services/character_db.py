@@ -18,6 +18,19 @@
 
 class CharacterDB(object):
 
+    ALPHABETICAL_SYMBOL = 1
+    ORDINARY_SYMBOL = 2
+    BINARY_OPERATION = 4
+    BIG_OPERATOR = 8
+    RELATION = 16
+    PUNCTUATION_MARK = 32
+    OPENING_SYMBOL = 64
+    CLOSING_SYMBOL = 128
+    EMOJI = 256
+    MATHSYMBOL = 255
+
+    categories = None
+
     alphabetical_symbols = {'𝑎', '𝑏', '𝑐', '𝑑', '𝑒', '𝑓', '𝑔', '\u210E', '𝑖', '𝑗', '𝑘', '𝑙', '𝑚', '𝑛', '𝑜', '𝑝', '𝑞', '𝑟', '𝑠', '𝑡', '𝑢', '𝑣', '𝑤', '𝑥', '𝑦', '𝑧', '𝐴', '𝐵', '𝐶', '𝐷', '𝐸', '𝐹', '𝐺', '𝐻', '𝐼', '𝐽', '𝐾', '𝐿', '𝑀', '𝑁', '𝑂', '𝑃', '𝑄', '𝑅', '𝑆', '𝑇', '𝑈', '𝑉', '𝑊', '𝑋', '𝑌', '𝑍', '𝛼', '𝛽', '𝛾', '𝛿', '𝜀', '𝜁', '𝜂', '𝜃', '𝜄', '𝜅', '𝜆', '𝜇', '𝜈', '𝜉', '𝜊', '𝜋', '𝜌', '𝜍', '𝜎', '𝜏', '𝜐', '𝜑', '𝜒', '𝜓', '𝜔', '𝜕', '𝜖', '𝜗', '𝜘', '𝜙', '𝜚', '𝜛', '𝛢', '𝛣', '𝛤', '𝛥', '𝛦', '𝛧', '𝛨', '𝛩', '𝛪', '𝛫', '𝛬', '𝛭', '𝛮', '𝛯', '𝛰', '𝛱', '𝛲', '𝛳', '𝛴', '𝛵', '𝛶', '𝛷', '𝛸', '𝛹', '𝛺', 'α', 'β', 'γ', 'δ', 'ε', 'ζ', 'η', 'θ', 'ι', 'κ', 'λ', 'μ', 'ν', 'ξ', 'ο', 'π', 'ρ', 'ς', 'σ', 'τ', 'υ', 'φ', 'χ', 'ψ', 'ω', 'ϊ', 'ϋ', 'ό', 'ύ', 'ώ', 'Ϗ', 'ϐ', 'ϑ', 'ϒ', 'ϓ', 'ϔ', 'ϕ', 'ϖ', 'ϗ', 'Ϙ', 'ϙ', 'Ϛ', 'ϛ', 'Ϝ', 'ϝ', 'Ϟ', 'ϟ', 'Ϡ', 'ϡ', 'Ϣ', 'ϣ', 'Ϥ', 'ϥ', 'Ϧ', 'ϧ', 'Ϩ', 'ϩ', 'Ϫ', 'ϫ', 'Ϭ', 'ϭ', 'Ϯ', 'ϯ', 'ϰ', 'ϱ', 'ϲ', 'ϳ', 'ϴ', 'ϵ', 'Α', 'Β', 'Γ', 'Δ', 'Ε', 'Ζ', 'Η', 'Θ', 'Ι', 'Κ', 'Λ', 'Μ', 'Ν', 'Ξ', 'Ο', 'Π', 'Ρ', 'Σ', 'Τ', 'Υ', 'Φ', 'Χ', 'Ψ', 'Ω', '𝒜', 'ℬ', '𝒞', '𝒟', 'ℰ', 'ℱ', '𝒢', 'ℋ', 'ℐ', '𝒥', '𝒦', 'ℒ', 'ℳ', '𝒩', '𝒪', '𝒫', '𝒬', 'ℛ', '𝒮', '𝒯', '𝒰', '𝒱', '𝒲', '𝒳', '𝒴', '𝒵'}
     ordinary_symbols = {'0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '!', '?', '.', '|', '‖', '/', '′', '@', '"', '¬', '∞', '\\', '∅', '♯', '♭', '♮', '∠', '∢', '∡', '♣', '♢', '♡', '♠', '∀', '∃', '∄', '∁', 'ℕ', 'ℤ', 'ℚ', '𝕀', 'ℝ', 'ℂ', 'ℑ', 'ℜ', 'ℵ', '℘', 'ℏ', '𝚤', '𝚥', '𝕂', 'ℓ', '⊥', '⊤', '∂', '∇', 'ð', '℧', '⋮', '⋯', ' '}
     binary_operations = {'+', '−', '∗', '±', '∓', '×', '÷', '∗', '⋆', '◦', '•', '⋇', '⋉', '⋊', '·', '∔', '⋋', '⋌', '⨿', '⊗', '⊕', '⊖', '⊘', '⊙', '⊚', '⊝', '⊛', '△', '▽', '◁', '▷', '∪', '∩', '⊎', '≀', '⧵', '⊓', '⊔', '∧', '∨', '†', '‡', '⊺'}
@@ -390,28 +403,49 @@ class CharacterDB(object):
         return CharacterDB.latex_to_unicode[name]
 
     def is_emoji(char):
-        return char in CharacterDB.emojis
+        return CharacterDB.get_category(char) & CharacterDB.EMOJI != 0
 
     def is_mathsymbol(char):
-        return char in CharacterDB.ordinary_symbols or char in CharacterDB.binary_operations or char in CharacterDB.relations or char in CharacterDB.punctuation_marks or char in CharacterDB.opening_symbols or char in CharacterDB.closing_symbols or char in CharacterDB.alphabetical_symbols or char in CharacterDB.big_operators
+        return CharacterDB.get_category(char) & CharacterDB.MATHSYMBOL != 0
 
     def is_ordinary_symbol(char):
-        return char in CharacterDB.ordinary_symbols or char in CharacterDB.alphabetical_symbols
+        return CharacterDB.get_category(char) & (CharacterDB.ORDINARY_SYMBOL | CharacterDB.ALPHABETICAL_SYMBOL) != 0
 
     def is_binary_operation(char):
-        return char in CharacterDB.binary_operations
+        return CharacterDB.get_category(char) & CharacterDB.BINARY_OPERATION != 0
 
     def is_relation(char):
-        return char in CharacterDB.relations
+        return CharacterDB.get_category(char) & CharacterDB.RELATION != 0
 
     def is_punctuation_mark(char):
-        return char in CharacterDB.punctuation_marks
+        return CharacterDB.get_category(char) & CharacterDB.PUNCTUATION_MARK != 0
 
     def is_opening_symbol(char):
-        return char in CharacterDB.opening_symbols
+        return CharacterDB.get_category(char) & CharacterDB.OPENING_SYMBOL != 0
 
     def is_closing_symbol(char):
-        return char in CharacterDB.closing_symbols
+        return CharacterDB.get_category(char) & CharacterDB.CLOSING_SYMBOL != 0
+
+    def get_category(char):
+        if CharacterDB.categories == None:
+            CharacterDB.build_categories()
+        return CharacterDB.categories.get(char, 0)
+
+    # one bitmask per character, built on first use so importing stays cheap.
+    def build_categories():
+        categories = dict()
+        for chars, category in [(CharacterDB.alphabetical_symbols, CharacterDB.ALPHABETICAL_SYMBOL),
+                                (CharacterDB.ordinary_symbols, CharacterDB.ORDINARY_SYMBOL),
+                                (CharacterDB.binary_operations, CharacterDB.BINARY_OPERATION),
+                                (CharacterDB.big_operators, CharacterDB.BIG_OPERATOR),
+                                (CharacterDB.relations, CharacterDB.RELATION),
+                                (CharacterDB.punctuation_marks, CharacterDB.PUNCTUATION_MARK),
+                                (CharacterDB.opening_symbols, CharacterDB.OPENING_SYMBOL),
+                                (CharacterDB.closing_symbols, CharacterDB.CLOSING_SYMBOL),
+                                (CharacterDB.emojis, CharacterDB.EMOJI)]:
+            for char in chars:
+                categories[char] = categories.get(char, 0) | category
+        CharacterDB.categories = categories
 
     def has_replacement(text):
         return text in CharacterDB.replacements
@@ -21,6 +21,7 @@ class ColorManager(object):
     main_window = None
     rgba_cache = dict()
     string_cache = dict()
+    version = 0
 
     def init(main_window):
         ColorManager.main_window = main_window
@@ -28,6 +29,7 @@ class ColorManager(object):
     def invalidate_cache():
         ColorManager.rgba_cache = dict()
         ColorManager.string_cache = dict()
+        ColorManager.version += 1
 
     def get_ui_color(name):
         if not name in ColorManager.rgba_cache:
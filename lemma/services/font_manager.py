@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# Copyright (C) 2017-present Robert Griesel
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>
+
+import gi
+gi.require_version('HarfBuzz', '0.0')
+from gi.repository import HarfBuzz
+
+import threading
+
+import lib.freetype2.freetype2 as freetype2
+import lib.fontconfig.fontconfig as fontconfig
+
+
+class FontManager():
+
+    lock = threading.Lock()
+    filenames = set()
+    faces = dict()
+    harfbuzz_faces = dict()
+    harfbuzz_fonts = dict()
+
+    # faces are shared between the shaper's threads and the renderer, loading a glyph has to hold this lock.
+    face_lock = threading.Lock()
+
+    # files are registered with fontconfig right away, the ui refers to some of them by family name.
+    def register_file(filename):
+        if filename not in FontManager.filenames:
+            fontconfig.Config.get_current().app_font_add_file(filename)
+            FontManager.filenames.add(filename)
+
+    # faces are only opened on first use, one per file, size and scale, so their size never has to change.
+    # the shaper measures at scale 1, which makes it share faces with the renderer.
+    def get_face(filename, size, scale=1):
+        if (filename, size, scale) not in FontManager.faces:
+            with FontManager.lock:
+                if (filename, size, scale) not in FontManager.faces:
+                    face = freetype2.get_default_lib().new_face(filename)
+                    face.set_char_size(size=size * scale, resolution=72)
+                    FontManager.faces[(filename, size, scale)] = face
+
+        return FontManager.faces[(filename, size, scale)]
+
+    # the harfbuzz blob and face are shared by all sizes of a file.
+    def get_harfbuzz_font(filename, size):
+        if (filename, size) not in FontManager.harfbuzz_fonts:
+            with FontManager.lock:
+                if filename not in FontManager.harfbuzz_faces:
+                    harfbuzz_blob = HarfBuzz.blob_create_from_file_or_fail(filename)
+                    FontManager.harfbuzz_faces[filename] = HarfBuzz.face_create(harfbuzz_blob, 0)
+
+                if (filename, size) not in FontManager.harfbuzz_fonts:
+                    harfbuzz_font = HarfBuzz.font_create(FontManager.harfbuzz_faces[filename])
+                    HarfBuzz.font_set_scale(harfbuzz_font, size * 64, size * 64)
+                    FontManager.harfbuzz_fonts[(filename, size)] = harfbuzz_font
+
+        return FontManager.harfbuzz_fonts[(filename, size)]
+
+
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# Copyright (C) 2017-present Robert Griesel
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>
+
+
+import ctypes
+import cairo
+
+
+class GlyphAtlas(object):
+
+    def __init__(self, format=cairo.Format.ARGB32, width=1024, height=1024):
+        self.format = format
+        self.width = width
+        self.height = height
+        self.padding = 1
+
+        self.surface = None
+        self.address = None
+        self.shelves = list()
+        self.glyphs = dict()
+        self.used_area = 0
+        self.oversized_bytes = 0
+        self.evictions = 0
+        self.reset()
+
+    # a new surface instead of clearing the old one, so blits queued from the old surface stay valid.
+    def reset(self):
+        self.surface = cairo.ImageSurface(self.format, self.width, self.height)
+        self.address = ctypes.addressof(ctypes.c_char.from_buffer(self.surface.get_data()))
+        self.shelves = list()
+        self.glyphs = dict()
+        self.used_area = 0
+        self.oversized_bytes = 0
+
+    # entries are (atlas surface, x, y, width, height, left, top).
+    def add(self, key, surface, left, top):
+        if surface == None:
+            self.glyphs[key] = (None, 0, 0, 0, 0, 0, 0)
+            return self.glyphs[key]
+
+        width, height = surface.get_width(), surface.get_height()
+        if not self.fits(width, height):
+            self.oversized_bytes += surface.get_stride() * surface.get_height()
+            self.glyphs[key] = (surface, 0, 0, width, height, left, top)
+            return self.glyphs[key]
+
+        x, y = self.place(width, height)
+        ctx = cairo.Context(self.surface)
+        ctx.set_source_surface(surface, x, y)
+        ctx.rectangle(x, y, width, height)
+        ctx.fill()
+
+        self.glyphs[key] = (self.surface, x, y, width, height, left, top)
+        return self.glyphs[key]
+
+    # freetype bitmaps (A8 atlases only) are copied row by row straight into the atlas memory,
+    # without any surface in between. buffer is the address of the bitmap's pixels.
+    def add_bitmap(self, key, buffer, width, height, pitch, left, top):
+        if width == 0 or height == 0:
+            self.glyphs[key] = (None, 0, 0, 0, 0, 0, 0)
+            return self.glyphs[key]
+
+        if not self.fits(width, height):
+            surface = cairo.ImageSurface(cairo.Format.A8, width, height)
+            GlyphAtlas.copy_rows(buffer, pitch, ctypes.addressof(ctypes.c_char.from_buffer(surface.get_data())), surface.get_stride(), width, height)
+            surface.mark_dirty()
+            self.oversized_bytes += surface.get_stride() * surface.get_height()
+            self.glyphs[key] = (surface, 0, 0, width, height, left, top)
+            return self.glyphs[key]
+
+        x, y = self.place(width, height)
+        stride = self.surface.get_stride()
+        self.surface.flush()
+        GlyphAtlas.copy_rows(buffer, pitch, self.address + y * stride + x, stride, width, height)
+        self.surface.mark_dirty_rectangle(x, y, width, height)
+
+        self.glyphs[key] = (self.surface, x, y, width, height, left, top)
+        return self.glyphs[key]
+
+    def copy_rows(source, source_pitch, target, target_pitch, width, height):
+        for i in range(height):
+            ctypes.memmove(target + i * target_pitch, source + i * source_pitch, width)
+
+    def fits(self, width, height):
+        return width + self.padding <= self.width and height + self.padding <= self.height
+
+    # the atlas is started over when it's full.
+    def place(self, width, height):
+        position = self.allocate(width + self.padding, height + self.padding)
+        if position == None:
+            self.evictions += 1
+            self.reset()
+            position = self.allocate(width + self.padding, height + self.padding)
+
+        self.used_area += (width + self.padding) * (height + self.padding)
+        return position
+
+    # shelf packing: glyphs go on the first shelf they fit on, otherwise on a new shelf below the last one.
+    def allocate(self, width, height):
+        for shelf in self.shelves:
+            if height <= shelf[1] and shelf[2] + width <= self.width:
+                x = shelf[2]
+                shelf[2] += width
+                return (x, shelf[0])
+
+        y = self.shelves[-1][0] + self.shelves[-1][1] if len(self.shelves) > 0 else 0
+        if y + height > self.height: return None
+
+        self.shelves.append([y, height, width])
+        return (0, y)
+
+    # the atlas surface, plus the surfaces of glyphs too large for it.
+    def get_size(self):
+        return self.surface.get_stride() * self.surface.get_height() + self.oversized_bytes
+
+    def get_occupancy(self):
+        return self.used_area / (self.width * self.height)
+
+
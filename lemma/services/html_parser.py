@@ -20,7 +20,6 @@ from html.parser import HTMLParser as HTMLParserLib
 
 from lemma.document.ast import Root, Node
 from lemma.widgets.image import Image
-from lemma.services.layout_info import LayoutInfo
 
 
 class HTMLParser(HTMLParserLib):
@@ -78,17 +77,17 @@ class HTMLParser(HTMLParserLib):
         if tag in ['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol']:
             self.paragraph_style = tag
         if tag == 'img':
-            width = LayoutInfo.get_max_layout_width()
+            attributes = dict()
             for name, value in attrs:
                 if name == 'src':
                     filename = urllib.parse.unquote_plus(value)
                 if name == 'width':
-                    width = int(value)
+                    attributes['width'] = int(value)
 
             try:
                 with open(os.path.join(self.path, filename), 'rb') as file:
                     data = file.read()
-                image = Image(data, attributes={'width': width})
+                image = Image(data, attributes=attributes)
                 node = Node('widget', image)
                 self.composite.append(node)
             except FileNotFoundError: pass
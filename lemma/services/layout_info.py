@@ -18,9 +18,13 @@
 
 class LayoutInfo():
 
-    def get_max_layout_width():
+    # only used until the document view knows its width.
+    def get_default_layout_width():
         return 670
 
+    def get_min_layout_width():
+        return 300
+
     def get_title_width():
         return 500
 
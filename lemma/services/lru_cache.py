@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# Copyright (C) 2017-present Robert Griesel
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>
+
+
+import collections
+
+
+class LRUCache(object):
+
+    # budget is in bytes, get_size returns the byte size of a value.
+    def __init__(self, budget, get_size):
+        self.budget = budget
+        self.get_size = get_size
+
+        self.entries = collections.OrderedDict()
+        self.sizes = dict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        self.misses += 1
+        return None
+
+    def add(self, key, value):
+        if key in self.entries:
+            self.bytes -= self.sizes[key]
+
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        self.sizes[key] = self.get_size(value)
+        self.bytes += self.sizes[key]
+        self.evict()
+
+    # the newest entry is kept even if it is over budget on its own.
+    def evict(self):
+        while self.bytes > self.budget and len(self.entries) > 1:
+            key, value = self.entries.popitem(last=False)
+            self.bytes -= self.sizes.pop(key)
+            self.evictions += 1
+
+    def values(self):
+        return self.entries.values()
+
+    def items(self):
+        return self.entries.items()
+
+    def get_stats(self):
+        return {'entries': len(self.entries), 'bytes': self.bytes, 'budget': self.budget, 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
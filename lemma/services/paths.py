@@ -16,7 +16,7 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>
 
 import os.path
-from xdg.BaseDirectory import xdg_config_home
+from xdg.BaseDirectory import xdg_config_home, xdg_cache_home
 
 
 class Paths():
@@ -35,18 +35,39 @@ class Paths():
         pathname = Paths.get_stubs_folder()
         if not os.path.exists(pathname): os.makedirs(pathname)
 
+        pathname = Paths.get_layout_cache_folder()
+        if not os.path.exists(pathname): os.makedirs(pathname)
+
+        pathname = Paths.get_glyph_metrics_folder()
+        if not os.path.exists(pathname): os.makedirs(pathname)
+
         pathname = Paths.get_config_folder()
         if not os.path.isdir(pathname): os.makedirs(pathname)
 
+        pathname = Paths.get_emoji_cache_folder()
+        if not os.path.isdir(pathname): os.makedirs(pathname)
+
     def get_config_folder():
         return os.path.join(xdg_config_home, 'lemma')
 
+    def get_cache_folder():
+        return os.path.join(xdg_cache_home, 'lemma')
+
+    def get_emoji_cache_folder():
+        return os.path.join(Paths.get_cache_folder(), 'emojis')
+
     def get_notes_folder():
         return os.path.expanduser(Paths.get_config_folder() + '/notes')
 
     def get_stubs_folder():
         return os.path.expanduser(Paths.get_config_folder() + '/stubs')
 
+    def get_layout_cache_folder():
+        return os.path.expanduser(Paths.get_config_folder() + '/layout_cache')
+
+    def get_glyph_metrics_folder():
+        return os.path.join(Paths.get_cache_folder(), 'glyph_metrics')
+
     def get_user_themes_folder():
         return os.path.expanduser(Paths.get_config_folder() + '/themes')
 
@@ -56,6 +56,11 @@ class Settings():
         Settings.defaults['button_visible_insert_image'] = True
         Settings.defaults['button_visible_insert_link'] = True
 
+        # in bytes. the glyph budget counts whole atlases, each font style and scale takes 1 MiB (4 MiB for emojis),
+        # so this is room for all styles at two scales before any of them is dropped.
+        Settings.defaults['glyph_cache_budget'] = 64 * 1024 * 1024
+        Settings.defaults['icon_cache_budget'] = 16 * 1024 * 1024
+
         Settings.data = Settings.defaults
 
         try: filehandle = open(os.path.join(Paths.get_config_folder(), 'settings.pickle'), 'rb')
@@ -18,43 +18,63 @@
 import gi
 gi.require_version('Rsvg', '2.0')
 gi.require_version('HarfBuzz', '0.0')
-gi.require_version('Gdk', '4.0')
 from gi.repository import Rsvg
 from gi.repository import HarfBuzz
-from gi.repository import Gdk
 
 import cairo
-import os.path
+import os.path, os, shutil
 
 import lib.freetype2.freetype2 as freetype2
 import lemma.services.timer as timer
 
+from lemma.services.font_manager import FontManager
+from lemma.services.glyph_atlas import GlyphAtlas
+from lemma.services.lru_cache import LRUCache
 from lemma.services.paths import Paths
+from lemma.services.app_info import AppInfo
 
 
 class TextRenderer():
 
     fonts = dict()
-    icon_cache = dict()
+    atlases = None
+    icon_cache = None
+    glyph_hits = 0
+    glyph_misses = 0
+
+    # both caches are bounded by the memory of their surfaces (stride * height), budgets come from the settings.
+    # the glyph budget is spent in whole atlases (1 MiB for A8 fonts, 4 MiB for emojis) and the glyphs too large for them,
+    # so it bounds the number of font styles and scales kept around, not single glyphs.
+    def init(glyph_budget, icon_budget):
+        TextRenderer.atlases = LRUCache(glyph_budget, lambda atlas: atlas.get_size())
+        TextRenderer.icon_cache = LRUCache(icon_budget, lambda surface: surface.get_stride() * surface.get_height())
 
     def add_font(name, filename, size, ascend, descend):
         TextRenderer.fonts[name] = dict()
         TextRenderer.fonts[name]['size'] = size
         TextRenderer.fonts[name]['filename'] = filename
-        TextRenderer.fonts[name]['face'] = freetype2.get_default_lib().new_face(filename)
         TextRenderer.fonts[name]['ascend'] = ascend
         TextRenderer.fonts[name]['descend'] = -descend
         TextRenderer.fonts[name]['line_height'] = ascend + descend
-        TextRenderer.fonts[name]['cache'] = dict()
+
+    # atlas stats count lookups of whole atlases, glyph hits and misses are counted per character.
+    def get_cache_stats():
+        glyph_stats = {'hits': TextRenderer.glyph_hits, 'misses': TextRenderer.glyph_misses}
+        return {'atlases': TextRenderer.atlases.get_stats(), 'glyphs': glyph_stats, 'icons': TextRenderer.icon_cache.get_stats()}
+
+    def get_face(fontname, scale=1):
+        return FontManager.get_face(TextRenderer.fonts[fontname]['filename'], TextRenderer.fonts[fontname]['size'], scale)
 
     def get_icon_surface(icon_name, scale=1, default_color=None, highlight_color=None):
         if highlight_color == None:
             highlight_color = default_color
 
-        if (icon_name, scale, default_color, highlight_color) not in TextRenderer.icon_cache:
-            TextRenderer.load_icon_surface(icon_name, scale, default_color, highlight_color)
+        surface = TextRenderer.icon_cache.get((icon_name, scale, default_color, highlight_color))
+        if surface == None:
+            surface = TextRenderer.load_icon_surface(icon_name, scale, default_color, highlight_color)
+            TextRenderer.icon_cache.add((icon_name, scale, default_color, highlight_color), surface)
 
-        return TextRenderer.icon_cache[(icon_name, scale, default_color, highlight_color)]
+        return surface
 
     def load_icon_surface(icon_name, scale=1, default_color=None, highlight_color=None):
         res_path = Paths.get_resources_folder()
@@ -76,30 +96,76 @@ class TextRenderer():
         ctx = cairo.Context(surface)
         rsvg_handle.render_document(ctx, viewport)
 
-        TextRenderer.icon_cache[(icon_name, scale, default_color, highlight_color)] = surface
-
-    def get_glyph(char, fontname='book', color=None, scale=1):
-        if (char, color, scale) not in TextRenderer.fonts[fontname]['cache']:
-            TextRenderer.load_glyph(char, fontname, color, scale)
-
-        return TextRenderer.fonts[fontname]['cache'][(char, color, scale)]
+        return surface
 
-    def load_glyph(char, fontname, color, scale=1):
-        if fontname == 'emojis':
-            TextRenderer.load_emoji(char, scale)
+    # font glyphs are kept as alpha masks, color is applied when painting them. emojis keep their own colors.
+    def get_glyph(char, fontname='book', scale=1):
+        atlas = TextRenderer.get_atlas(fontname, scale)
+        if char in atlas.glyphs:
+            TextRenderer.glyph_hits += 1
         else:
-            TextRenderer.load_glyph_from_font(char, fontname, color, scale)
+            TextRenderer.glyph_misses += 1
+            if fontname == 'emojis':
+                surface, left, top = TextRenderer.load_emoji(char, scale)
+                atlas.add(char, surface, left, top)
+            else:
+                TextRenderer.load_glyph_from_font(char, fontname, scale, atlas)
+
+            # added again, so glyphs stored outside of the atlas surface are accounted for.
+            TextRenderer.atlases.add((fontname, scale), atlas)
+
+        return atlas.glyphs[char]
+
+    def get_atlas(fontname, scale=1):
+        atlas = TextRenderer.atlases.get((fontname, scale))
+        if atlas == None:
+            if fontname == 'emojis':
+                atlas = GlyphAtlas(cairo.Format.ARGB32)
+            else:
+                atlas = GlyphAtlas(cairo.Format.A8)
+            TextRenderer.atlases.add((fontname, scale), atlas)
+
+        return atlas
+
+    def get_atlas_stats():
+        stats = dict()
+        for key, atlas in TextRenderer.atlases.items():
+            stats[key] = {'glyphs': len(atlas.glyphs), 'occupancy': atlas.get_occupancy(), 'evictions': atlas.evictions}
+        return stats
+
+    # rendering the svg is slow, so emojis are kept as png files, one folder per app version and scale.
+    def init_emoji_cache():
+        for name in os.listdir(Paths.get_emoji_cache_folder()):
+            if name != AppInfo.get_lemma_version():
+                shutil.rmtree(os.path.join(Paths.get_emoji_cache_folder(), name), ignore_errors=True)
+
+    def get_emoji_cache_pathname(char, scale):
+        return os.path.join(Paths.get_emoji_cache_folder(), AppInfo.get_lemma_version(), str(scale), 'emoji_u' + hex(ord(char))[2:] + '.png')
 
     def load_emoji(char, scale):
-        TextRenderer.fonts['emojis']['face'].set_char_size(size=TextRenderer.fonts['emojis']['size'] * scale, resolution=72)
-        TextRenderer.fonts['emojis']['face'].load_char(ord(char), freetype2.FT.LOAD_DEFAULT)
-        TextRenderer.fonts['emojis']['face'].glyph.render_glyph(freetype2.FT.RENDER_MODE_NORMAL)
-
-        width = TextRenderer.fonts['emojis']['face'].glyph.advance.x
-        height = TextRenderer.fonts['emojis']['line_height']
         left = 0
         top = -TextRenderer.fonts['emojis']['ascend']
 
+        pathname = TextRenderer.get_emoji_cache_pathname(char, scale)
+        if os.path.isfile(pathname):
+            try: return (cairo.ImageSurface.create_from_png(pathname), left, top)
+            except (cairo.Error, IOError): pass
+
+        surface = TextRenderer.render_emoji(char, scale)
+
+        try:
+            os.makedirs(os.path.dirname(pathname), exist_ok=True)
+            surface.write_to_png(pathname)
+        except (cairo.Error, IOError): pass
+
+        return (surface, left, top)
+
+    def render_emoji(char, scale):
+        face = TextRenderer.get_face('emojis', scale)
+        with FontManager.face_lock:
+            width = face.get_advance(face.get_char_index(ord(char)), freetype2.FT.LOAD_DEFAULT)
+        height = TextRenderer.fonts['emojis']['line_height']
+
         viewport = Rsvg.Rectangle()
         viewport.x = 0
         viewport.y = 0
@@ -114,33 +180,17 @@ class TextRenderer():
         rsvg_handle = Rsvg.Handle.new_from_file(os.path.join(res_path, 'fonts/Noto_Color_Emoji/svg', filename))
         rsvg_handle.render_document(ctx, viewport)
 
-        TextRenderer.fonts['emojis']['cache'][(char, None, scale)] = (surface, left, top)
-
-    def load_glyph_from_font(char, fontname, color, scale):
-        TextRenderer.fonts[fontname]['face'].set_char_size(size=TextRenderer.fonts[fontname]['size'] * scale, resolution=72)
-        TextRenderer.fonts[fontname]['face'].load_char(ord(char), freetype2.FT.LOAD_DEFAULT)
-        TextRenderer.fonts[fontname]['face'].glyph.render_glyph(freetype2.FT.RENDER_MODE_NORMAL)
-
-        width = TextRenderer.fonts[fontname]['face'].glyph.advance.x
-        width = TextRenderer.fonts[fontname]['face'].glyph.metrics['width']
-        height = TextRenderer.fonts[fontname]['face'].glyph.metrics['height']
-        left = TextRenderer.fonts[fontname]['face'].glyph.bitmap_left
-        top = -TextRenderer.fonts[fontname]['face'].glyph.bitmap_top
-
-        if TextRenderer.fonts[fontname]['face'].glyph.bitmap.width > 0:
-            surface = cairo.ImageSurface(cairo.Format.ARGB32, int(width) + 1, int(height))
-            ctx = cairo.Context(surface)
-            ctx.set_source_surface(TextRenderer.fonts[fontname]['face'].glyph.bitmap.make_image_surface(), 0, 0)
-            pattern = ctx.get_source()
-            pattern.set_filter(cairo.Filter.BEST)
-            rgba = Gdk.RGBA()
-            rgba.parse(color)
-            ctx.set_source_rgba(rgba.red, rgba.green, rgba.blue, rgba.alpha)
-            ctx.mask(pattern)
-            ctx.fill()
-
-            TextRenderer.fonts[fontname]['cache'][(char, color, scale)] = (surface, left, top)
-        else:
-            TextRenderer.fonts[fontname]['cache'][(char, color, scale)] = (None, 0, 0)
+        return surface
+
+    # the bitmap goes straight from freetype's buffer into the atlas, so it has to happen under the lock.
+    def load_glyph_from_font(char, fontname, scale, atlas):
+        face = TextRenderer.get_face(fontname, scale)
+        with FontManager.face_lock:
+            face.load_char(ord(char), freetype2.FT.LOAD_DEFAULT)
+            slot = face.glyph
+            slot.render_glyph(freetype2.FT.RENDER_MODE_NORMAL)
+
+            left, top, width, height, pitch, buffer = slot.get_fields()[7:]
+            atlas.add_bitmap(char, buffer, width, height, pitch, left, -top)
 
 
@@ -19,36 +19,46 @@ import gi
 gi.require_version('HarfBuzz', '0.0')
 from gi.repository import HarfBuzz
 
+import threading
+
 import lib.freetype2.freetype2 as freetype2
-import lib.fontconfig.fontconfig as fontconfig
+from lemma.services.font_manager import FontManager
 import lemma.services.timer as timer
 
 
 class TextShaper():
 
     fonts = dict()
-    harfbuzz_buffer = HarfBuzz.buffer_create()
+    thread_data = threading.local()
     harfbuzz_features = [HarfBuzz.feature_from_string(b'liga 0')[1], HarfBuzz.feature_from_string(b'kern 1')[1]]
 
+    # latin, greek, arrows and math operators, math alphanumerics.
+    prewarm_ranges = [(0x20, 0x250), (0x370, 0x400), (0x2190, 0x2300), (0x1D400, 0x1D800)]
+
+    # fonts are only described here, faces are opened by the font manager on first use.
     def add_font(name, filename, size, ascend, descend, padding_top, padding_bottom):
-        fontconfig.Config.get_current().app_font_add_file(filename)
+        FontManager.register_file(filename)
 
         TextShaper.fonts[name] = dict()
         TextShaper.fonts[name]['filename'] = filename
-        face = freetype2.get_default_lib().new_face(filename)
-        face.set_char_size(size=size, resolution=72)
-        TextShaper.fonts[name]['face'] = face
+        TextShaper.fonts[name]['size'] = size
         TextShaper.fonts[name]['ascend'] = ascend
         TextShaper.fonts[name]['descend'] = -descend
         TextShaper.fonts[name]['line_height'] = TextShaper.fonts[name]['ascend'] - TextShaper.fonts[name]['descend']
         TextShaper.fonts[name]['padding_top'] = padding_top
         TextShaper.fonts[name]['padding_bottom'] = padding_bottom
-        harfbuzz_blob = HarfBuzz.blob_create_from_file_or_fail(filename)
-        harfbuzz_face = HarfBuzz.face_create(harfbuzz_blob, 0)
-        TextShaper.fonts[name]['harfbuzz_font'] = HarfBuzz.font_create(harfbuzz_face)
-        HarfBuzz.font_set_scale(TextShaper.fonts[name]['harfbuzz_font'], size * 64, size * 64)
         TextShaper.fonts[name]['char_extents'] = dict()
 
+    def get_face(fontname):
+        return FontManager.get_face(TextShaper.fonts[fontname]['filename'], TextShaper.fonts[fontname]['size'])
+
+    def get_harfbuzz_font(fontname):
+        return FontManager.get_harfbuzz_font(TextShaper.fonts[fontname]['filename'], TextShaper.fonts[fontname]['size'])
+
+    # everything measurements depend on, persisted measurements are discarded when it changes.
+    def get_font_config():
+        return tuple((name, font['filename'], font['size'], font['ascend'], font['descend']) for name, font in sorted(TextShaper.fonts.items()))
+
     def get_descend(fontname='book'):
         return TextShaper.fonts[fontname]['descend']
 
@@ -63,16 +73,36 @@ class TextShaper():
 
     def measure_single(char, fontname='book'):
         if char not in TextShaper.fonts[fontname]['char_extents']:
-            TextShaper.load_glyph(char, fontname)
+            with FontManager.face_lock:
+                if char not in TextShaper.fonts[fontname]['char_extents']:
+                    TextShaper.load_glyph(char, fontname)
 
         return TextShaper.fonts[fontname]['char_extents'][char]
 
+    # advances are all that's persisted, the line height comes from the font config.
+    def get_char_advances(fontname):
+        with FontManager.face_lock:
+            return {char: extents[0] for char, extents in TextShaper.fonts[fontname]['char_extents'].items()}
+
+    def add_char_advances(fontname, advances):
+        line_height = TextShaper.fonts[fontname]['line_height']
+        with FontManager.face_lock:
+            for char, width in advances.items():
+                if char not in TextShaper.fonts[fontname]['char_extents']:
+                    TextShaper.fonts[fontname]['char_extents'][char] = [width, line_height]
+
+    # harfbuzz buffers can't be shared between threads, so every thread shapes with its own.
+    def get_harfbuzz_buffer():
+        if not hasattr(TextShaper.thread_data, 'harfbuzz_buffer'):
+            TextShaper.thread_data.harfbuzz_buffer = HarfBuzz.buffer_create()
+        return TextShaper.thread_data.harfbuzz_buffer
+
     def measure(text, fontname='book'):
-        harfbuzz_buffer = TextShaper.harfbuzz_buffer
+        harfbuzz_buffer = TextShaper.get_harfbuzz_buffer()
         HarfBuzz.buffer_reset(harfbuzz_buffer)
         HarfBuzz.buffer_add_utf8(harfbuzz_buffer, text.encode('utf8'), 0, -1)
         HarfBuzz.buffer_guess_segment_properties(harfbuzz_buffer)
-        HarfBuzz.shape(TextShaper.fonts[fontname]['harfbuzz_font'], harfbuzz_buffer, TextShaper.harfbuzz_features)
+        HarfBuzz.shape(TextShaper.get_harfbuzz_font(fontname), harfbuzz_buffer, TextShaper.harfbuzz_features)
 
         result = []
         positions = HarfBuzz.buffer_get_glyph_positions(harfbuzz_buffer)
@@ -82,28 +112,64 @@ class TextShaper():
 
         return result
 
-    def load_glyph(char, fontname):
-        if fontname == 'emojis':
-            TextShaper.load_emoji(char)
-        else:
-            TextShaper.load_glyph_from_font(char, fontname)
+    # words are shaped in a single call, separated by line breaks so there is no kerning across them.
+    # glyphs are mapped back to chars by their cluster, i.e. the utf8 offset of the char they belong to.
+    def measure_words(words, fontname='book'):
+        harfbuzz_buffer = TextShaper.get_harfbuzz_buffer()
+        HarfBuzz.buffer_reset(harfbuzz_buffer)
+        HarfBuzz.buffer_add_utf8(harfbuzz_buffer, '\n'.join(words).encode('utf8'), 0, -1)
+        HarfBuzz.buffer_guess_segment_properties(harfbuzz_buffer)
+        HarfBuzz.shape(TextShaper.get_harfbuzz_font(fontname), harfbuzz_buffer, TextShaper.harfbuzz_features)
 
-    def load_emoji(char):
-        TextShaper.fonts['emojis']['face'].load_char(ord(char), freetype2.FT.LOAD_DEFAULT)
-        TextShaper.fonts['emojis']['face'].glyph.render_glyph(freetype2.FT.RENDER_MODE_NORMAL)
+        line_height = TextShaper.fonts[fontname]['line_height']
+        result = []
+        chars_by_cluster = dict()
+        offset = 0
+        for word in words:
+            result.append([])
+            for char in word:
+                result[-1].append([0, line_height])
+                chars_by_cluster[offset] = result[-1][-1]
+                offset += len(char.encode('utf8'))
+            offset += 1
+
+        infos = HarfBuzz.buffer_get_glyph_infos(harfbuzz_buffer)
+        positions = HarfBuzz.buffer_get_glyph_positions(harfbuzz_buffer)
+        for info, pos in zip(infos, positions):
+            if info.cluster in chars_by_cluster:
+                chars_by_cluster[info.cluster][0] += pos.x_advance
+        for extents_list in result:
+            for extents in extents_list:
+                extents[0] = int(extents[0] / 64)
 
-        width = TextShaper.fonts['emojis']['face'].glyph.advance.x
-        height = TextShaper.fonts['emojis']['line_height']
+        return result
 
-        TextShaper.fonts['emojis']['char_extents'][char] = [width, height]
+    # only the advance is needed, so glyphs are loaded without being rendered.
+    def load_glyph(char, fontname):
+        face = TextShaper.get_face(fontname)
+        width = face.get_advance(face.get_char_index(ord(char)), freetype2.FT.LOAD_DEFAULT)
+        height = TextShaper.fonts[fontname]['line_height']
 
-    def load_glyph_from_font(char, fontname):
-        TextShaper.fonts[fontname]['face'].load_char(ord(char), freetype2.FT.LOAD_DEFAULT)
-        TextShaper.fonts[fontname]['face'].glyph.render_glyph(freetype2.FT.RENDER_MODE_NORMAL)
+        TextShaper.fonts[fontname]['char_extents'][char] = [width, height]
 
-        width = TextShaper.fonts[fontname]['face'].glyph.advance.x
+    # measures all chars of a codepoint range the font has a glyph for, in one pass.
+    def measure_range(start, stop, fontname='book'):
+        face = TextShaper.get_face(fontname)
+        char_extents = TextShaper.fonts[fontname]['char_extents']
         height = TextShaper.fonts[fontname]['line_height']
 
-        TextShaper.fonts[fontname]['char_extents'][char] = [width, height]
+        for codepoint in range(start, stop):
+            if chr(codepoint) in char_extents: continue
+
+            with FontManager.face_lock:
+                glyph_index = face.get_char_index(codepoint)
+                if glyph_index != 0:
+                    char_extents[chr(codepoint)] = [face.get_advance(glyph_index, freetype2.FT.LOAD_DEFAULT), height]
+
+    # run in the background at startup, so the first layout rarely has to load glyphs.
+    def prewarm(fontnames):
+        for fontname in fontnames:
+            for start, stop in TextShaper.prewarm_ranges:
+                TextShaper.measure_range(start, stop, fontname)
 
 
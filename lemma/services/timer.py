@@ -15,12 +15,16 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>
 
-import time
+import time, threading
 
 
 def timer(original_function):
 
     def new_function(*args, **kwargs):
+        # the timer hierarchy is a single stack, so only calls on the main thread are recorded.
+        if threading.current_thread() != threading.main_thread():
+            return original_function(*args, **kwargs)
+
         Timer.start(original_function.__module__[6:] + '.' + original_function.__name__)
         return_value = original_function(*args, **kwargs)
         Timer.stop(original_function.__module__[6:] + '.' + original_function.__name__)
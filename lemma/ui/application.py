@@ -22,6 +22,7 @@ from gi.repository import Adw
 from lemma.services.color_manager import ColorManager
 from lemma.ui.dialogs.dialog_locator import DialogLocator
 from lemma.ui.popovers.popover_manager import PopoverManager
+from lemma.use_cases.use_cases import UseCases
 import lemma.services.timer as timer
 
 import lemma.ui.colors as colors
@@ -117,6 +118,8 @@ class Application(Adw.Application):
 
     def save_quit(self):
         self.window_state.save_window_state()
+        UseCases.update_layout_cache()
+        UseCases.update_glyph_metrics()
         self.quit()
 
 
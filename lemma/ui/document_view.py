@@ -77,9 +77,15 @@ class DocumentView():
         document_changed = max(document.last_cursor_movement, document.last_modified) > self.last_cache_reset
         do_draw = False
 
+        # lines are laid out again when the background layout catches up or the view is resized.
+        # changed lines get new layouts, which the presenter's render cache doesn't know yet.
+        if document.update_background_layout():
+            do_draw = True
+
         if self.document != None:
             if new_active_document or document_changed:
-                self.presenter.render_cache = dict()
+                if new_active_document:
+                    self.presenter.render_cache = dict()
                 self.last_cache_reset = time.time()
                 self.reset_cursor_blink()
 
@@ -43,6 +43,7 @@ class DocumentViewPresenter():
 
         self.window_surface = None
         self.render_cache = dict()
+        self.glyph_blits = list()
 
     @timer.timer
     def draw(self, snapshot):
@@ -56,42 +57,49 @@ class DocumentViewPresenter():
 
         content_offset_x = LayoutInfo.get_document_padding_left()
         content_offset_y = LayoutInfo.get_normal_document_offset() + ApplicationState.get_value('title_buttons_height') - self.model.scrolling_position_y
+        document.realize_paragraphs_in_range(-content_offset_y, self.height - content_offset_y)
 
         self.first_selection_node = document.get_first_selection_bound()
         self.last_selection_node = document.get_last_selection_bound()
         first_selection_line = document.get_ancestors(self.first_selection_node.layout)[-2]
         last_selection_line = document.get_ancestors(self.last_selection_node.layout)[-2]
+        has_selection = self.first_selection_node != self.last_selection_node
 
         ctx = snapshot.append_cairo(Graphene.Rect().init(0, 0, self.width, self.height))
 
         ctx.scale(self.hidpi_factor_inverted, self.hidpi_factor_inverted)
-        in_selection = False
-        list_item_numbers = [0, 0, 0, 0, 0]
-        for i, paragraph in enumerate(document.ast.paragraphs):
-            if paragraph.style == 'ol':
-                list_item_numbers[paragraph.indentation_level] += 1
-                if paragraph.indentation_level < 4:
-                    list_item_numbers = list_item_numbers[:paragraph.indentation_level + 1] + [0, 0, 0, 0, 0][paragraph.indentation_level + 1:]
-            else:
-                list_item_numbers = list_item_numbers[:paragraph.indentation_level] + [0, 0, 0, 0, 0][paragraph.indentation_level:]
+        first_selection_y = first_selection_line['y'] + first_selection_line['parent']['y']
+        last_selection_y = last_selection_line['y'] + last_selection_line['parent']['y']
+        visible_lines = set()
+        for i in range(document.get_paragraph_no_at_y(-content_offset_y), len(document.ast.paragraphs)):
+            paragraph = document.ast.paragraphs[i]
+            if content_offset_y + paragraph.layout['y'] > self.height: break
 
-            if content_offset_y + paragraph.layout['y'] + paragraph.layout['height'] >= 0 and content_offset_y + paragraph.layout['y'] <= self.height:
-                self.draw_bullet(ctx, content_offset_x, content_offset_y, paragraph, list_item_numbers)
+            if content_offset_y + paragraph.layout['y'] + paragraph.layout['height'] >= 0:
+                self.draw_bullet(ctx, content_offset_x, content_offset_y, paragraph)
 
-            for j, line_layout in enumerate(paragraph.layout['children']):
+            for line_layout in paragraph.layout['children']:
                 if content_offset_y + line_layout['y'] + paragraph.layout['y'] + line_layout['height'] >= 0 and content_offset_y + line_layout['y'] + paragraph.layout['y'] <= self.height:
-                    if (i,j) not in self.render_cache:
-                        self.draw_line(ctx, i, j, line_layout, in_selection)
+                    in_selection = first_selection_y < line_layout['y'] + paragraph.layout['y'] <= last_selection_y
+                    first_node = self.first_selection_node if line_layout is first_selection_line and has_selection else None
+                    last_node = self.last_selection_node if line_layout is last_selection_line and has_selection else None
+                    version = (in_selection, first_node, last_node, self.hidpi_factor, ColorManager.version)
+
+                    # layouts are replaced, never changed, when their paragraph changes. so a line is identified
+                    # by its layout, which is kept in the entry to make sure the id isn't reused.
+                    entry = self.render_cache.get(id(line_layout))
+                    if entry == None or entry[0] is not line_layout or entry[1] != version:
+                        entry = (line_layout, version, self.draw_line(ctx, line_layout, in_selection))
+                        self.render_cache[id(line_layout)] = entry
 
                     line_x = self.device_offset_x + math.floor(content_offset_x) * self.hidpi_factor
                     line_y = self.device_offset_y + math.floor(content_offset_y + paragraph.layout['y'] + line_layout['y']) * self.hidpi_factor
-                    ctx.set_source_surface(self.render_cache[(i,j)], line_x, line_y)
+                    ctx.set_source_surface(entry[2], line_x, line_y)
                     ctx.paint()
-                elif (i,j) in self.render_cache:
-                    del(self.render_cache[(i,j)])
+                    visible_lines.add(id(line_layout))
 
-                if not in_selection and line_layout['y'] + line_layout['parent']['y'] == first_selection_line['y'] + first_selection_line['parent']['y']: in_selection = True
-                if in_selection and line_layout['y'] + line_layout['parent']['y'] == last_selection_line['y'] + last_selection_line['parent']['y']: in_selection = False
+        for key in [key for key in self.render_cache if key not in visible_lines]:
+            del(self.render_cache[key])
 
         if ApplicationState.get_value('drop_cursor_position') != None:
             self.draw_drop_cursor(ctx, content_offset_x, content_offset_y)
@@ -111,41 +119,39 @@ class DocumentViewPresenter():
         self.device_offset_y = 1 - ((allocation.get_y() + surface_transform.y) * self.hidpi_factor) % 1
 
     @timer.timer
-    def draw_bullet(self, ctx, offset_x, offset_y, paragraph, list_item_numbers):
+    def draw_bullet(self, ctx, offset_x, offset_y, paragraph):
         if paragraph.style == 'ul':
             layout = paragraph.layout
             line_layout = layout['children'][0]
             first_char_layout = line_layout['children'][0]
             baseline = TextShaper.get_ascend(fontname=first_char_layout['fontname'])
-            fg_color = ColorManager.get_ui_color_string('bullets')
+            fg_color = ColorManager.get_ui_color('bullets')
 
-            surface, left, top = TextRenderer.get_glyph('-', 'book', fg_color, self.hidpi_factor)
-            bullet_indent = LayoutInfo.get_indentation('ul', paragraph.indentation_level) - LayoutInfo.get_ul_bullet_padding() - surface.get_width()
+            glyph = TextRenderer.get_glyph('-', 'book', self.hidpi_factor)
+            bullet_indent = LayoutInfo.get_indentation('ul', paragraph.indentation_level) - LayoutInfo.get_ul_bullet_padding() - glyph[3]
             bullet_measurement = TextShaper.measure_single('-')
 
-            bullet_x = self.device_offset_x + math.floor(offset_x + bullet_indent) * self.hidpi_factor + left
-            bullet_y = self.device_offset_y + math.floor(offset_y + baseline + layout['y'] + line_layout['height'] - bullet_measurement[1]) * self.hidpi_factor + top
-            ctx.set_source_surface(surface, bullet_x, bullet_y)
-            ctx.paint()
+            bullet_x = self.device_offset_x + math.floor(offset_x + bullet_indent) * self.hidpi_factor + glyph[5]
+            bullet_y = self.device_offset_y + math.floor(offset_y + baseline + layout['y'] + line_layout['height'] - bullet_measurement[1]) * self.hidpi_factor + glyph[6]
+            self.paint_glyph(ctx, glyph, bullet_x, bullet_y, fg_color)
 
         elif paragraph.style == 'ol':
             layout = paragraph.layout
             line_layout = layout['children'][0]
             first_char_layout = line_layout['children'][0]
             baseline = TextShaper.get_ascend(fontname=first_char_layout['fontname'])
-            fg_color = ColorManager.get_ui_color_string('bullets')
+            fg_color = ColorManager.get_ui_color('bullets')
 
-            text = '.' + ''.join(reversed(str(list_item_numbers[paragraph.indentation_level])))
+            text = '.' + ''.join(reversed(str(paragraph.list_item_numbers[paragraph.indentation_level])))
             bullet_indent = LayoutInfo.get_indentation('ol', paragraph.indentation_level) - LayoutInfo.get_ol_bullet_padding()
             for char, dim in zip(text, TextShaper.measure(text, 'book')):
-                surface, left, top = TextRenderer.get_glyph(char, 'book', fg_color, self.hidpi_factor)
+                glyph = TextRenderer.get_glyph(char, 'book', self.hidpi_factor)
                 bullet_indent -= dim[0]
                 bullet_measurement = TextShaper.measure_single(char)
 
-                bullet_x = self.device_offset_x + math.floor(offset_x + bullet_indent) * self.hidpi_factor + left
-                bullet_y = self.device_offset_y + math.floor(offset_y + baseline + layout['y'] + line_layout['height'] - bullet_measurement[1]) * self.hidpi_factor + top
-                ctx.set_source_surface(surface, bullet_x, bullet_y)
-                ctx.paint()
+                bullet_x = self.device_offset_x + math.floor(offset_x + bullet_indent) * self.hidpi_factor + glyph[5]
+                bullet_y = self.device_offset_y + math.floor(offset_y + baseline + layout['y'] + line_layout['height'] - bullet_measurement[1]) * self.hidpi_factor + glyph[6]
+                self.paint_glyph(ctx, glyph, bullet_x, bullet_y, fg_color)
 
         elif paragraph.style == 'cl':
             layout = paragraph.layout
@@ -168,10 +174,51 @@ class DocumentViewPresenter():
             ctx.paint()
 
     @timer.timer
-    def draw_line(self, ctx, paragraph_no, line_no, layout, in_selection):
+    def draw_line(self, ctx, layout, in_selection):
         surface = ctx.get_target().create_similar_image(cairo.Format.ARGB32, int((layout['x'] + layout['width']) * self.hidpi_factor), int(layout['height'] * self.hidpi_factor) + 1)
-        self.draw_layout(layout, cairo.Context(surface), 0, -layout['y'], in_selection)
-        self.render_cache[(paragraph_no, line_no)] = surface
+        ctx = cairo.Context(surface)
+        self.glyph_blits = list()
+        self.draw_layout(layout, ctx, 0, -layout['y'], in_selection)
+        self.paint_glyph_blits(ctx, surface.get_width(), surface.get_height())
+
+        return surface
+
+    # glyphs go last. the ones with a color are first copied into an alpha mask per color,
+    # each as a plain rectangle fill, then every mask is painted once with its color as source.
+    def paint_glyph_blits(self, ctx, width, height):
+        masks = dict()
+        for glyph, x, y, color in self.glyph_blits:
+            if color == None:
+                self.paint_glyph(ctx, glyph, x, y)
+                continue
+
+            key = (color.red, color.green, color.blue, color.alpha)
+            if key not in masks:
+                masks[key] = (color, cairo.Context(cairo.ImageSurface(cairo.Format.A8, width, height)))
+            self.paint_glyph(masks[key][1], glyph, x, y)
+        self.glyph_blits = list()
+
+        for color, mask_ctx in masks.values():
+            Gdk.cairo_set_source_rgba(ctx, color)
+            ctx.mask_surface(mask_ctx.get_target(), 0, 0)
+
+    # paint the glyph's sub-rectangle of its atlas, its 1px transparent border included.
+    # glyphs with a color are alpha masks, without one they are copied as they are (emojis, or into a line mask).
+    def paint_glyph(self, ctx, glyph, x, y, color=None):
+        surface, atlas_x, atlas_y, width, height, left, top = glyph
+        if surface == None: return
+
+        if color == None:
+            ctx.set_source_surface(surface, x - atlas_x, y - atlas_y)
+            ctx.rectangle(x - 1, y - 1, width + 2, height + 2)
+            ctx.fill()
+        else:
+            ctx.save()
+            ctx.rectangle(x - 1, y - 1, width + 2, height + 2)
+            ctx.clip()
+            Gdk.cairo_set_source_rgba(ctx, color)
+            ctx.mask_surface(surface, x - atlas_x, y - atlas_y)
+            ctx.restore()
 
     def draw_layout(self, layout, ctx, offset_x, offset_y, in_selection):
         if layout['type'] == 'char':
@@ -181,16 +228,11 @@ class DocumentViewPresenter():
             baseline = TextShaper.get_ascend(fontname=fontname)
 
             if fontname != 'emojis':
-                fg_color = self.get_fg_color_string_by_node(layout['node'])
-                surface, left, top = TextRenderer.get_glyph(layout['node'].value, fontname, fg_color, self.hidpi_factor)
-                if surface != None:
-                    ctx.set_source_surface(surface, int((offset_x + layout['x']) * self.hidpi_factor + left), int((offset_y + baseline + layout['y']) * self.hidpi_factor + top))
-                    ctx.paint()
+                fg_color = self.get_fg_color_by_node(layout['node'])
             else:
-                surface, left, top = TextRenderer.get_glyph(layout['node'].value, fontname, None, self.hidpi_factor)
-                if surface != None:
-                    ctx.set_source_surface(surface, int((offset_x + layout['x']) * self.hidpi_factor + left), int((offset_y + baseline + layout['y']) * self.hidpi_factor + top))
-                    ctx.paint()
+                fg_color = None
+            glyph = TextRenderer.get_glyph(layout['node'].value, fontname, self.hidpi_factor)
+            self.glyph_blits.append((glyph, int((offset_x + layout['x']) * self.hidpi_factor + glyph[5]), int((offset_y + baseline + layout['y']) * self.hidpi_factor + glyph[6]), fg_color))
 
         if layout['type'] == 'widget':
             if in_selection: self.draw_selection(layout, ctx, offset_x, offset_y)
@@ -201,8 +243,9 @@ class DocumentViewPresenter():
             top = -TextShaper.get_descend(fontname=fontname)
 
             matrix = ctx.get_matrix()
-            widget_factor_x = widget.get_width() * self.hidpi_factor / widget.get_original_width()
-            widget_factor_y = widget.get_height() * self.hidpi_factor / widget.get_original_height()
+            scale = layout['width'] / widget.get_width()
+            widget_factor_x = layout['width'] * self.hidpi_factor / widget.get_original_width()
+            widget_factor_y = widget.get_height() * scale * self.hidpi_factor / widget.get_original_height()
             ctx.scale(widget_factor_x, widget_factor_y)
 
             ctx.set_source_surface(surface, (offset_x + layout['x']) * self.hidpi_factor / widget_factor_x, (offset_y + layout['y'] + top) * self.hidpi_factor / widget_factor_y)
@@ -216,11 +259,9 @@ class DocumentViewPresenter():
             fontname = layout['fontname']
             baseline = TextShaper.get_ascend(fontname=fontname)
 
-            fg_color = self.get_fg_color_string_by_node(layout['node'])
-            surface, left, top = TextRenderer.get_glyph('▯', fontname, fg_color, self.hidpi_factor)
-
-            ctx.set_source_surface(surface, int((offset_x + layout['x']) * self.hidpi_factor + left), int((offset_y + baseline + layout['y']) * self.hidpi_factor + top))
-            ctx.paint()
+            fg_color = self.get_fg_color_by_node(layout['node'])
+            glyph = TextRenderer.get_glyph('▯', fontname, self.hidpi_factor)
+            self.glyph_blits.append((glyph, int((offset_x + layout['x']) * self.hidpi_factor + glyph[5]), int((offset_y + baseline + layout['y']) * self.hidpi_factor + glyph[6]), fg_color))
 
         if layout['type'] == 'mathroot':
             if in_selection: self.draw_selection(layout, ctx, offset_x, offset_y)
@@ -272,14 +313,6 @@ class DocumentViewPresenter():
         ctx.rectangle(math.floor((offset_x + layout['x']) * self.hidpi_factor), math.floor(offset_y * self.hidpi_factor), math.ceil(layout['width'] * self.hidpi_factor), math.ceil(layout['parent']['height'] * self.hidpi_factor))
         ctx.fill()
 
-    @timer.timer
-    def get_fg_color_string_by_node(self, node):
-        if node.link == None:
-            return ColorManager.get_ui_color_string('text')
-        if node.link.startswith('http') or len(DocumentRepo.list_by_title(node.link)) > 0:
-            return ColorManager.get_ui_color_string('links')
-        return ColorManager.get_ui_color_string('links_page_not_existing')
-
     @timer.timer
     def get_fg_color_by_node(self, node):
         if node.link == None:
@@ -20,7 +20,6 @@ gi.require_version('Gtk', '4.0')
 from gi.repository import Gtk, Pango
 
 from lemma.services.message_bus import MessageBus
-from lemma.services.layout_info import LayoutInfo
 from lemma.application_state.application_state import ApplicationState
 from lemma.repos.workspace_repo import WorkspaceRepo
 from lemma.use_cases.use_cases import UseCases
@@ -60,21 +59,22 @@ class ToolBars():
         selected_nodes = active_document.get_selected_nodes()
         if len(selected_nodes) == 1 and selected_nodes[0].type == 'widget' and selected_nodes[0].value.is_resizable():
             widget = selected_nodes[0].value
+            max_width = active_document.get_max_widget_width(selected_nodes[0])
 
             self.toolbar.mode_stack.set_visible_child_name('widget_resizable')
 
             self.toolbar.toolbar_widget_resizable.status_label.set_text(widget.get_status_text())
             layout = Pango.Layout(self.toolbar.toolbar_widget_resizable.status_label.get_pango_context())
-            layout.set_text(widget.get_longest_possible_status_text())
+            layout.set_text(widget.get_longest_possible_status_text(max_width))
             self.toolbar.toolbar_widget_resizable.status_label.set_size_request(layout.get_extents()[0].width / Pango.SCALE + 20, -1)
 
-            self.toolbar.toolbar_widget_resizable.scale.set_range(widget.get_minimum_width(), LayoutInfo.get_max_layout_width())
+            self.toolbar.toolbar_widget_resizable.scale.set_range(widget.get_minimum_width(), max_width)
 
-            self.toolbar.toolbar_widget_resizable.scale.set_value(widget.get_width())
+            self.toolbar.toolbar_widget_resizable.scale.set_value(min(widget.get_width(), max_width))
             self.toolbar.toolbar_widget_resizable.scale.clear_marks()
 
             orig_width = widget.get_original_width()
-            if orig_width > widget.get_minimum_width() and orig_width < LayoutInfo.get_max_layout_width():
+            if orig_width > widget.get_minimum_width() and orig_width < max_width:
                 self.toolbar.toolbar_widget_resizable.scale.add_mark(orig_width, Gtk.PositionType.TOP)
         else:
             if edit_link_visible:
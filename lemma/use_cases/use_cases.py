@@ -30,6 +30,8 @@ from lemma.services.node_type_db import NodeTypeDB
 from lemma.document.ast import Node
 from lemma.repos.workspace_repo import WorkspaceRepo
 from lemma.repos.document_repo import DocumentRepo
+from lemma.repos.layout_cache_repo import LayoutCacheRepo
+from lemma.repos.glyph_metrics_repo import GlyphMetricsRepo
 from lemma.document.document import Document
 from lemma.services.message_bus import MessageBus
 from lemma.services.html_parser import HTMLParser
@@ -124,6 +126,7 @@ class UseCases():
         elif link_target != None:
             target_list = DocumentRepo.list_by_title(link_target)
 
+            LayoutCacheRepo.update(workspace.get_active_document())
             if len(target_list) > 0:
                 document = DocumentRepo.get_by_id(target_list[0]['id'])
                 document.scroll_to_xy(0, 0, animation_type=None)
@@ -232,6 +235,7 @@ class UseCases():
         workspace = WorkspaceRepo.get_workspace()
 
         if document_id != workspace.get_active_document_id():
+            LayoutCacheRepo.update(workspace.get_active_document())
             document = DocumentRepo.get_by_id(document_id)
         else:
             document = workspace.get_active_document()
@@ -241,6 +245,12 @@ class UseCases():
         MessageBus.add_message('mode_set')
         MessageBus.add_message('history_changed')
 
+    def update_layout_cache():
+        LayoutCacheRepo.update(WorkspaceRepo.get_workspace().get_active_document())
+
+    def update_glyph_metrics():
+        GlyphMetricsRepo.update()
+
     def pin_document(document_id):
         workspace = WorkspaceRepo.get_workspace()
 
@@ -451,6 +461,8 @@ class UseCases():
     def add_image(image):
         document = WorkspaceRepo.get_workspace().get_active_document()
 
+        image.set_width(min(image.get_width(), document.get_max_widget_width(document.get_insert_node())))
+
         document.start_undoable_action()
         node = Node('widget', image)
         document.insert_nodes([node])
@@ -711,25 +723,17 @@ class UseCases():
         new_node = None
         ancestors = document.get_ancestors(insert.layout)
         for i, box in enumerate(ancestors):
-            if new_node == None and box['type'] == 'vbox' or box['type'] == 'paragraph':
+            if new_node == None and box['type'] in {'vbox', 'paragraph'}:
                 if box['type'] == 'vbox':
                     j = box['children'].index(ancestors[i - 1])
-                    prev_hboxes = box['children'][:j]
+                    prev_hboxes = reversed(box['children'][:j])
                 elif box['type'] == 'paragraph':
-                    prev_hboxes = []
-                    for paragraph in document.ast.paragraphs:
-                        for hbox in paragraph.layout['children']:
-                            if hbox['y'] + hbox['parent']['y'] < ancestors[i - 1]['y'] + ancestors[i - 1]['parent']['y']:
-                                prev_hboxes.append(hbox)
-                for hbox in reversed(prev_hboxes):
-                    if new_node == None:
-                        min_distance = 10000
-                        for layout in hbox['children']:
-                            layout_x, layout_y = document.get_absolute_xy(layout)
-                            distance = abs(layout_x - x)
-                            if distance < min_distance:
-                                new_node = layout['node']
-                                min_distance = distance
+                    prev_hboxes = document.get_lines_above(ancestors[i - 1])
+                for hbox in prev_hboxes:
+                    layout = document.get_child_closest_to_x(hbox, x)
+                    if layout != None:
+                        new_node = layout['node']
+                        break
         if new_node == None:
             new_node = document.ast[0]
 
@@ -755,25 +759,17 @@ class UseCases():
         new_node = None
         ancestors = document.get_ancestors(insert.layout)
         for i, box in enumerate(ancestors):
-            if new_node == None and box['type'] == 'vbox' or box['type'] == 'paragraph':
+            if new_node == None and box['type'] in {'vbox', 'paragraph'}:
                 if box['type'] == 'vbox':
                     j = box['children'].index(ancestors[i - 1])
-                    prev_hboxes = box['children'][j + 1:]
+                    next_hboxes = box['children'][j + 1:]
                 elif box['type'] == 'paragraph':
-                    prev_hboxes = []
-                    for paragraph in document.ast.paragraphs:
-                        for hbox in paragraph.layout['children']:
-                            if hbox['y'] + hbox['parent']['y'] > ancestors[i - 1]['y'] + ancestors[i - 1]['parent']['y']:
-                                prev_hboxes.append(hbox)
-                for child in prev_hboxes:
-                    if new_node == None:
-                        min_distance = 10000
-                        for layout in child['children']:
-                            layout_x, layout_y = document.get_absolute_xy(layout)
-                            distance = abs(layout_x - x)
-                            if distance < min_distance:
-                                new_node = layout['node']
-                                min_distance = distance
+                    next_hboxes = document.get_lines_below(ancestors[i - 1])
+                for hbox in next_hboxes:
+                    layout = document.get_child_closest_to_x(hbox, x)
+                    if layout != None:
+                        new_node = layout['node']
+                        break
         if new_node == None:
             new_node = document.ast[-1]
 
@@ -865,15 +861,9 @@ class UseCases():
 
         if len(selected_nodes) == 1 and selected_nodes[0].type == 'placeholder':
             node = node.next()
+        node = document.get_next_placeholder(node)
 
-        while not node.type == 'placeholder':
-            if node == document.ast[-1]:
-                node = document.ast[0]
-            else:
-                node = node.next()
-            if node == insert: break
-
-        if node.type == 'placeholder':
+        if node != None:
             document.select_node(node)
             document.scroll_insert_on_screen(ApplicationState.get_value('document_view_height'), animation_type='default')
 
@@ -891,15 +881,9 @@ class UseCases():
 
         if insert.type == 'placeholder' or (len(selected_nodes) == 1 and selected_nodes[0].type == 'placeholder'):
             node = node.prev()
+        node = document.get_prev_placeholder(node)
 
-        while not node.type == 'placeholder':
-            if node == document.ast[0]:
-                node = document.ast[-1]
-            else:
-                node = node.prev()
-            if node == insert: break
-
-        if node.type == 'placeholder':
+        if node != None:
             document.select_node(node)
             document.scroll_insert_on_screen(ApplicationState.get_value('document_view_height'), animation_type='default')
 
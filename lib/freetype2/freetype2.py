@@ -2599,6 +2599,36 @@ class GlyphSlot :
             self._ftobj.contents.bitmap_top
     #end bitmap_left
 
+    def get_fields(self) :
+        "returns the frequently used fields of the GlyphSlot in one read, without" \
+        " going through the property conversions: (advance_x, advance_y, width, height," \
+        " hori_bearing_x, hori_bearing_y, hori_advance, bitmap_left, bitmap_top," \
+        " bitmap_width, bitmap_rows, bitmap_pitch, bitmap_buffer). Advance and metrics" \
+        " are in (possibly fractional) pixels, the bitmap fields are integers and only" \
+        " meaningful after rendering. bitmap_buffer is the address of the bitmap pixels," \
+        " valid until the next glyph is loaded into the slot."
+        slot = self._ftobj.contents
+        advance = slot.advance
+        metrics = slot.metrics
+        bitmap = slot.bitmap
+        return \
+            (
+                advance.x / 64,
+                advance.y / 64,
+                metrics.width / 64,
+                metrics.height / 64,
+                metrics.horiBearingX / 64,
+                metrics.horiBearingY / 64,
+                metrics.horiAdvance / 64,
+                slot.bitmap_left,
+                slot.bitmap_top,
+                bitmap.width,
+                bitmap.rows,
+                bitmap.pitch,
+                bitmap.buffer,
+            )
+    #end get_fields
+
     def own_bitmap(self) :
         "ensures the GlyphSlot has its own copy of bitmap storage."
         check(ft.FT_GlyphSlot_Own_Bitmap(self._ftobj))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# Copyright (C) 2017-present Robert Griesel
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>
+
+
+# cold glyph rasterization throughput: every glyph is rendered by freetype and stored once,
+# either the old way (copied bitmap surface, masked into an ARGB32 surface) or straight into an A8 atlas.
+
+import sys
+import os.path
+import time
+
+sys.dont_write_bytecode = True
+
+src_path = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, src_path)
+
+import cairo
+
+import lib.freetype2.freetype2 as freetype2
+from lemma.services.glyph_atlas import GlyphAtlas
+
+
+font_filename = os.path.join(src_path, 'data', 'resources', 'fonts', 'newcomputermodern', 'otf', 'NewCM10-Book.otf')
+chars = [chr(i) for i in range(0x21, 0x250)]
+scales = [1, 2]
+rounds = 5
+
+
+def load_face(scale):
+    face = freetype2.get_default_lib().new_face(font_filename)
+    face.set_char_size(size=19.407 * scale, resolution=72)
+    return face
+
+def render(face, char):
+    face.load_char(ord(char), freetype2.FT.LOAD_DEFAULT)
+    face.glyph.render_glyph(freetype2.FT.RENDER_MODE_NORMAL)
+    return face.glyph
+
+def store_copied_surface(face, char, cache):
+    glyph = render(face, char)
+    if glyph.bitmap.width == 0: return
+
+    bitmap_surface = glyph.bitmap.make_image_surface()
+    surface = cairo.ImageSurface(cairo.Format.ARGB32, int(glyph.metrics['width']) + 1, int(glyph.metrics['height']))
+    ctx = cairo.Context(surface)
+    ctx.set_source_surface(bitmap_surface, 0, 0)
+    pattern = ctx.get_source()
+    pattern.set_filter(cairo.Filter.BEST)
+    ctx.set_source_rgba(0, 0, 0, 1)
+    ctx.mask(pattern)
+    cache[char] = surface
+
+def store_in_atlas(face, char, atlas):
+    glyph = render(face, char)
+    left, top, width, height, pitch, buffer = glyph.get_fields()[7:]
+    atlas.add_bitmap(char, buffer, width, height, pitch, left, -top)
+
+def run(name, store, make_cache):
+    faces = [load_face(scale) for scale in scales]
+    best = None
+    for i in range(rounds):
+        start = time.perf_counter()
+        for face in faces:
+            cache = make_cache()
+            for char in chars:
+                store(face, char, cache)
+        duration = time.perf_counter() - start
+        best = duration if best == None else min(best, duration)
+
+    count = len(chars) * len(scales)
+    print('{:<16} {:>8.0f} glyphs/s   {:>6.1f} µs/glyph'.format(name, count / best, best / count * 1000000))
+
+
+run('copied surface', store_copied_surface, dict)
+run('atlas', store_in_atlas, lambda: GlyphAtlas(cairo.Format.A8))
+
+